@@ -1,6 +1,4 @@
 import concurrent.futures
-import heapq
-import pickle
 import random
 import h5py
 import numpy as np
@@ -12,10 +10,19 @@ from src.strategies.references.random import Random
 from src.strategies.references.q_learning import QLearning
 from src.strategies.ucb.tile_coded_ucb import TileCodedUCB
 from src.strategies.ucb.ucb import UCB
+from src.antennas import assign_antennas
+from src.capacity import GSLModel, ISLModel, check_gsl_model
+from src.links import LinkGeometry, LinkTable
+from src.metrics import MetricContext, compute_metrics, default_metrics
+from src.results import ResultsWriter
+from src.routing import RoutingOracle
+from src.telemetry import TelemetryWriter
+from src.trace import SharedTrace, attach_shared_trace, open_trace
 from src.utils import Time
 from src.groundstation import Groundstation
 from src.paketmanager import PaketManager
 from src.satellite import Satellite
+from src.state import NetworkState
 from scipy.spatial import KDTree
 
 # DOUBLE CHECK, IF THESE PARAMETERS MATCH THE ONES USED BY COSMICBEATS WHEN CALCULATING POSITIONS/VISIBILITY/...
@@ -24,6 +31,13 @@ TIME_STEPS_PER_FILE = 1000
 NUM_SATELLITES = 636
 NUM_GROUNDSTATIONS = 146
 ANTENNAS_PER_GROUNDSTATION = 8
+ANTENNA_ASSIGNMENT = "nearest"  # policy of src/antennas.py, "nearest" or "elevation"
+CHECK_GSL_MODEL = False  # recompute every GSL capacity with the scalar Satellite.gsl_capacity and report differences
+STREAM_ABSOLUTE_TOLERANCE = 1  # bit/s, update_streams ends once a sweep changes the traffic by less than
+STREAM_RELATIVE_TOLERANCE = 1e-6  # the absolute tolerance + the relative tolerance * total generation rate
+STREAM_MAX_SWEEPS = 100
+STREAM_MAX_UPDATES = 100000  # forwarded streams per step, the number of paths can grow exponentially
+STREAM_DRAIN_GROUNDSTATIONS = False  # queued groundstations still forward to the core once propagation stops
 TIME_DELTA = 15
 START_TIME = "2023-09-28 08:26:00"
 FAILURE_TIME = "2023-09-30 08:26:00"
@@ -40,21 +54,17 @@ def set_seed(seed=0):
     np.random.seed(seed)
 
 
-def save_evaluation_data(eps, tim, avg_delay, drop_rate, cost, gen_rate, tp, avg_h, main_link_output, file):
+def save_evaluation_data(eps, tim, metrics, writer, diagnostics):
     data = {
         'episode': eps,
         'time': tim,
-        'avg_delay': avg_delay,
-        'drop_rate': drop_rate,
-        'generation_rate': gen_rate,
-        'throughput': tp,
-        'avg_hops': avg_h,
-        'main_link_out': main_link_output,
-        'cost': cost
+        **metrics,
+        'stream_iterations': diagnostics["iterations"],
+        'stream_residual': diagnostics["residual"],
+        'stream_truncated': diagnostics["truncated"]
     }
 
-    with open(file, 'ab') as f:
-        pickle.dump(data, f)
+    writer.append(data)
 
 
 def assign_positions_to_satellites(satellites, earth_coordinate_positions):
@@ -114,193 +124,195 @@ def network_failure_groundstations(current_time, failed_groundstation_ids):
         return failed_groundstation_ids
 
 
-def update_groundstations(groundstations, satellites):
+def update_groundstations(satellites, network_state, trace_step):
+    gsl_indptr, gsl_indices = assign_antennas(network_state, trace_step.gsl_indptr, trace_step.gsl_indices,
+                                              ANTENNAS_PER_GROUNDSTATION, ANTENNA_ASSIGNMENT)
     for sat in satellites:
-        sat.GSL_connections = []
-
-    closest_satellites = {}
-
-    for gs in groundstations:
-        closest_satellites[gs.id] = []
-
-    for sat in satellites:
-        for gs_id in sat.visible_groundstations:
-            gs = groundstations[gs_id - NUM_SATELLITES]
-            distance = gs.state.distance_to(sat.state)
-            heapq.heappush(closest_satellites[gs_id], (-distance, sat.id))
-
-    for gs in closest_satellites:
-        closest_satellites[gs].sort(key=lambda x: -x[0])
-
-    for gs in closest_satellites:
-        gsls = 0
-        for dist, sat_id in closest_satellites[gs]:
-            if gsls < ANTENNAS_PER_GROUNDSTATION:
-                satellites[sat_id].GSL_connections += [gs]
-                gsls += 1
+        sat.GSL_connections = gsl_indices[gsl_indptr[sat.id]:gsl_indptr[sat.id + 1]]
 
 
 def network_init():
     print("INITIALIZATION")
 
+    network_state = NetworkState(NUM_SATELLITES, NUM_GROUNDSTATIONS)
+
     # initialize groundstations
     print("init groundstations")
-    groundstations = [Groundstation(gs_id) for gs_id in range(NUM_SATELLITES, NUM_SATELLITES + NUM_GROUNDSTATIONS)]
+    groundstations = [Groundstation(gs_id, network_state)
+                      for gs_id in range(NUM_SATELLITES, NUM_SATELLITES + NUM_GROUNDSTATIONS)]
     with h5py.File(f'data/positions/groundstation_positions/groundstation_positions.h5', 'r') as p:
-        dset = p['positions']
-        gs_index = 0
-        for groundstation in groundstations:
-            groundstation.state_update(*dset[0, gs_index, :])
-            gs_index += 1
+        network_state.update_positions(p['positions'][0], first_id=NUM_SATELLITES)
 
     # initialize satellites
     print("init satellites")
     atmospheric_attenuation = np.load("data/atmospheric_attenuation.npy")
     Satellite.atmospheric_attenuation = atmospheric_attenuation
-    satellites = [Satellite(sat_id) for sat_id in range(NUM_SATELLITES)]
+    satellites = [Satellite(sat_id, network_state) for sat_id in range(NUM_SATELLITES)]
+    LinkGeometry.isl_model = ISLModel(satellites[0])
+    LinkTable.gsl_model = GSLModel(satellites[0], NUM_SATELLITES)
 
     # initialize the paket manager
     print("init paket manager")
-    paket_manager = PaketManager(satellites, groundstations)
+    paket_manager = PaketManager(satellites, groundstations, absolute_tolerance=STREAM_ABSOLUTE_TOLERANCE,
+                                 relative_tolerance=STREAM_RELATIVE_TOLERANCE, max_sweeps=STREAM_MAX_SWEEPS,
+                                 max_stream_updates=STREAM_MAX_UPDATES,
+                                 drain_groundstations=STREAM_DRAIN_GROUNDSTATIONS)
+
+    return satellites, groundstations, paket_manager, network_state
+
+
+def get_rng_state():
+    return random.getstate(), np.random.get_state()
+
+
+def set_rng_state(state):
+    random.setstate(state[0])
+    np.random.set_state(state[1])
+
+
+def results_file(strategy, gsl_failures, isl_failures, growth_factor, rep_no, prefix="results/evaluation_data_"):
+    return (prefix
+            + strategy.strategy_name + "_"
+            + str(int(gsl_failures)) + "_"
+            + str(int(isl_failures)) + "_"
+            f"{growth_factor:.1f}_"
+            + str(rep_no) +
+            ".h5")
 
-    return satellites, groundstations, paket_manager
+
+def share_topology(satellites, other_satellites):
+    for sat, other in zip(satellites, other_satellites):
+        other.ISL_connections = sat.ISL_connections
+        other.visible_groundstations = sat.visible_groundstations
+        other.GSL_connections = sat.GSL_connections
 
 
 def run(strategy, rep_no, growth_factor=1, gsl_failures=False, isl_failures=False, max_time_steps=7 * 24 * 60 * 4,
-        logging=False, seed=0):
+        logging=False, seed=0, trace_dir=None, logging_fields=None, logging_every=1, extra_metrics=()):
 
-    set_seed(seed)
+    run_lockstep([strategy], rep_no, growth_factor, gsl_failures, isl_failures, max_time_steps, logging, seed,
+                 trace_dir, logging_fields, logging_every, extra_metrics)
 
-    satellites, groundstations, paket_manager = network_init()
 
-    if logging:
-        with open("logging/old/log_groundstations.csv", "a") as file:
-            file.write("time; "
-                       "id; "
-                       "position; "
-                       "outgoing_throughput; "
-                       "incoming_streams; "
-                       "outgoing_streams; "
-                       "delay; "
-                       "drop_rate "
-                       "\n")
-        with open("logging/old/log_satellites.csv", "a") as file:
-            file.write("time; "
-                       "id; "
-                       "position; "
-                       "neighbours; "
-                       "target_ids; "
-                       "generation_rate; "
-                       "outgoing_throughputs; "
-                       "incoming_streams; "
-                       "outgoing_streams; "
-                       "delay; "
-                       "drop_rate; "
-                       "cost \n")
+def run_lockstep(strategies, rep_no, growth_factor=1, gsl_failures=False, isl_failures=False,
+                 max_time_steps=7 * 24 * 60 * 4, logging=False, seed=0, trace_dir=None, logging_fields=None,
+                 logging_every=1, extra_metrics=()):
+
+    # every strategy gets its own network copy and random number stream, seeded as if it ran alone
+    networks = []
+    rng_states = []
+    for _ in strategies:
+        set_seed(seed)
+        networks.append(network_init())
+        rng_states.append(get_rng_state())
+    for _, _, _, network_state in networks[1:]:
+        network_state.share_positions(networks[0][3])
 
     current_time = Time().from_str(START_TIME)
     step = 0
-    file_index = 0
-    failed_gsls_satellite_ids = []
-    failed_isls_satellite_ids = []
-    failed_gs_ids = []
+    trace = open_trace(trace_dir, steps_per_file=TIME_STEPS_PER_FILE)
+    failed_gsls_satellite_ids = [[] for _ in strategies]
+    failed_isls_satellite_ids = [[] for _ in strategies]
+    failed_gs_ids = [[] for _ in strategies]
+    metric_names = default_metrics + [name for name in extra_metrics if name not in default_metrics]
+    strategy_names = ", ".join(strategy.strategy_name for strategy in strategies)
+    writers = [ResultsWriter(results_file(strategy, gsl_failures, isl_failures, growth_factor, rep_no))
+               for strategy in strategies]
+    telemetry = None
+    if logging:
+        telemetry = [TelemetryWriter(results_file(strategy, gsl_failures, isl_failures, growth_factor, rep_no,
+                                                  prefix="logging/telemetry_"),
+                                     fields=logging_fields, every=logging_every)
+                     for strategy in strategies]
 
     while step < max_time_steps:
         if step % PRINT_EVERY_X_TIME_STEP == 0:
-            print(f"({strategy.strategy_name}) current time: {current_time}")
+            print(f"({strategy_names}) current time: {current_time}")
+
+        # the topology of the step is built once and shared by all network copies
+        satellites, groundstations, _, network_state = networks[0]
+        trace_step = trace.read(step)
+        network_state.update_positions(trace_step.positions)
+        network_state.update_generation_rates(trace_step.data_generation, growth_factor=growth_factor)
+        for satellite in satellites:
+            satellite.ISL_connections = trace_step.isl_connections(satellite.id)
+            satellite.visible_groundstations = trace_step.visible_groundstations(satellite.id)
+        update_groundstations(satellites, network_state, trace_step)
+
+        for other_satellites, _, _, _ in networks[1:]:
+            share_topology(satellites, other_satellites)
+
+        # link distances, elevations, ISL capacities before failures and the shortest paths over them
+        geometry = LinkGeometry(satellites)
+        routing = RoutingOracle(geometry)
+
+        for strategy_index, strategy in enumerate(strategies):
+            satellites, groundstations, paket_manager, network_state = networks[strategy_index]
+            set_rng_state(rng_states[strategy_index])
+
+            if isl_failures:
+                failed_isls_satellite_ids[strategy_index] = \
+                    isl_failures_satellites(current_time, failed_isls_satellite_ids[strategy_index])
+                for sat in satellites:
+                    sat.failed_isl = (sat.id in failed_isls_satellite_ids[strategy_index])
+
+            if gsl_failures:
+                failed_gsls_satellite_ids[strategy_index] = \
+                    gsl_failures_satellites(current_time, failed_gsls_satellite_ids[strategy_index])
+                for sat in satellites:
+                    sat.failed_gsl = (sat.id in failed_gsls_satellite_ids[strategy_index])
+
+            if GS_FAILURES:
+                failed_gs_ids[strategy_index] = network_failure_groundstations(current_time,
+                                                                               failed_gs_ids[strategy_index])
+                for gs in groundstations:
+                    gs.failed = (gs.id in failed_gs_ids[strategy_index])
+
+            # the failures and the GSL noise of this copy
+            random_state = np.random.get_state() if CHECK_GSL_MODEL else None
+            network_state.links = LinkTable(satellites, groundstations, geometry)
+            if CHECK_GSL_MODEL:
+                num_gsls, differing = check_gsl_model(satellites, groundstations, network_state.links, random_state)
+                if differing > 0:
+                    print(f"({strategy.strategy_name}) {differing} of {num_gsls} GSL capacities differ from "
+                          f"Satellite.gsl_capacity")
+            network_state.routing = routing
 
-        if isl_failures:
-            failed_isls_satellite_ids = isl_failures_satellites(current_time, failed_isls_satellite_ids)
             for sat in satellites:
-                sat.failed_isl = (sat.id in failed_isls_satellite_ids)
+                sat.target_ids = []
+            strategy.set_targets(satellites, groundstations, current_time)
 
-        if gsl_failures:
-            failed_gsls_satellite_ids = gsl_failures_satellites(current_time, failed_gsls_satellite_ids)
             for sat in satellites:
-                sat.failed_gsl = (sat.id in failed_gsls_satellite_ids)
+                sat.update_outgoing_throughput(groundstations, satellites)
 
-        if GS_FAILURES:
-            failed_gs_ids = network_failure_groundstations(current_time, failed_gs_ids)
+            # the random part of the step, set_rewards itself only evaluates the targets
             for gs in groundstations:
-                gs.failed = (gs.id in failed_gs_ids)
-
-        with (h5py.File(f'data/grid/grid_{file_index}.h5', 'r') as sv,
-              h5py.File(f'data/visibility/groundstation_visibility/satellite_visibility_groundstations_{file_index}.h5',
-                        'r') as gsv):
-            dset_sv = sv['visibility'][step % TIME_STEPS_PER_FILE]
-            dset_gsv = gsv['visibility'][step % TIME_STEPS_PER_FILE]
-            for s in satellites:
-                s.ISL_connections = dset_sv[s.id]
-                s.visible_groundstations = dset_gsv[s.id]
-
-        with h5py.File(f'data/positions/satellite_positions/satellite_positions_{file_index}.h5', 'r') as p:
-            dset = p['positions']
-            for satellite in satellites:
-                satellite.state_update(*dset[step % TIME_STEPS_PER_FILE, satellite.id, :])
-
-        with h5py.File(f'data/data_generation/satellite_data_generation_{file_index}.h5', 'r') as g:
-            dset = g['data_generation'][step % TIME_STEPS_PER_FILE]
-            for satellite in satellites:
-                satellite.update_generation_rate(dset, growth_factor=growth_factor)
-
-        for sat in satellites:
-            sat.target_ids = []
-        update_groundstations(groundstations, satellites)
-        strategy.set_targets(satellites, groundstations, current_time)
-
-        for sat in satellites:
-            sat.update_outgoing_throughput(groundstations, satellites)
-
-        paket_manager.set_rewards()
-        strategy.learn(satellites, groundstations, current_time)
-
-        if logging:
-            for gs in groundstations:
-                gs.logging("logging/log_groundstations.csv", current_time.to_str())
-            for sat in satellites:
-                sat.logging("logging/log_satellites.csv", current_time.to_str())
-
-        avg_delay = (sum(list(map(lambda n: n.generation_rate * (1 - n.drop_rate) * n.delay, satellites))) /
-                     sum(list(map(lambda n: n.generation_rate * (1 - n.drop_rate), satellites))))
+                gs.update_delay()
 
-        drop_rate = (sum(list(map(lambda n: n.generation_rate * n.drop_rate,
-                                  satellites))) /
-                     sum(list(map(lambda n: n.generation_rate, satellites))))
+            paket_manager.set_rewards()
+            strategy.learn(satellites, groundstations, current_time)
 
-        cost = (sum(list(map(lambda n: n.generation_rate * n.cost, satellites))) /
-                sum(list(map(lambda n: n.generation_rate, satellites))))
+            if logging:
+                telemetry[strategy_index].log(step, current_time.to_str(), satellites, groundstations)
 
-        generation_rate = sum(list(map(lambda n: n.generation_rate, satellites)))
+            context = MetricContext(network_state, *paket_manager.get_link_traffic(),
+                                    paket_manager.get_average_hops())
+            save_evaluation_data(step, current_time.to_str(), {**compute_metrics(context, metric_names),
+                                                               **strategy.stats()},
+                                 writers[strategy_index], paket_manager.diagnostics)
 
-        throughput = (1 - drop_rate) * generation_rate
-
-        average_hops = paket_manager.get_average_hops()
-
-        satellites_with_outgoing_traffic = list(filter(lambda n: sum(list(
-            map(lambda streams: sum(list(map(lambda stream: stream[1], streams))),
-                n.outgoing_streams.values()))) > 0, satellites))
-        main_link_out_share = \
-            (np.mean(list(
-                map(lambda n: sum(list(map(lambda stream: stream[1], n.outgoing_streams[n.target_ids[0]]))) /
-                              sum(list(map(lambda streams: sum(list(map(lambda stream: stream[1], streams))),
-                                           n.outgoing_streams.values()))),
-                    satellites_with_outgoing_traffic))))
-
-        save_evaluation_data(step, current_time.to_str(), avg_delay, drop_rate, cost, generation_rate,
-                             throughput, average_hops, main_link_out_share,
-                             file="results/evaluation_data_"
-                                  + strategy.strategy_name + "_"
-                                  + str(int(gsl_failures)) + "_"
-                                  + str(int(isl_failures)) + "_"
-                                  f"{growth_factor:.1f}_"
-                                  + str(rep_no) +
-                                  ".npy")
+            rng_states[strategy_index] = get_rng_state()
 
         step += 1
-        if step % TIME_STEPS_PER_FILE == 0:
-            file_index += 1
         current_time = current_time.add_seconds(TIME_DELTA)
 
+    trace.close()
+    for writer in writers:
+        writer.close()
+    if logging:
+        for telemetry_writer in telemetry:
+            telemetry_writer.close()
+
 
 def main():
     parser = argparse.ArgumentParser(description="Run strategies with specified parameters.")
@@ -310,54 +322,90 @@ def main():
     parser.add_argument("--isl_failures", type=bool, default=False, help="Enable isl failures (True/False).")
     parser.add_argument("--max_time_steps", type=int, default=4*60, help="Maximum time steps to run.")
     parser.add_argument("--logging", type=bool, default=False, help="Enable logging (True/False).")
+    parser.add_argument("--logging_fields", type=str, default=None,
+                        help="Comma-separated node fields to log (e.g. delay,drop_rate,links), default all.")
+    parser.add_argument("--logging_every", type=int, default=1, help="Log every x-th time step.")
+    parser.add_argument("--extra_metrics", type=str, default="",
+                        help="Comma-separated metrics from src/metrics.py to store besides the default ones "
+                             "(e.g. gs_load_max,delay_p95).")
+    parser.add_argument("--gounder_k", type=int, default=4, help="Number of next hops of the gounder strategy.")
+    parser.add_argument("--tile_memory_budget", type=float, default=None,
+                        help="Memory budget in bytes of hashed tiles for the tile_coded_ucb strategy, by default its "
+                             "tiles are unbounded dicts.")
     parser.add_argument("--seed", type=int, default=0, help="Random seed for reproducibility.")
     parser.add_argument("--repetitions", type=int, default=1, help="Number of repetitions for each strategy.")
+    parser.add_argument("--trace_dir", type=str, default=None,
+                        help="Packed trace directory (see src/calculators/trace_packer.py), default reads data/.")
+    parser.add_argument("--shared_trace", action=argparse.BooleanOptionalAction, default=True,
+                        help="Load the trace once into shared memory for all workers (--no-shared_trace to opt out).")
+    parser.add_argument("--lockstep", action=argparse.BooleanOptionalAction, default=False,
+                        help="Run all strategies of a repetition in one process over one trace pass.")
 
     args = parser.parse_args()
 
+    try:
+        tile_coded_ucb = TileCodedUCB(['distance'], 5e5, 2, memory_budget=args.tile_memory_budget)
+    except ValueError as error:
+        parser.error(f"--tile_memory_budget: {error}")
+
     strategies = [
         Random(),
         BentPipe(),
         Dijkstra(),
-        Gounder(),
+        Gounder(args.gounder_k),
         UCB(),
         QLearning(alpha=0.15, gamma=0.90, epsilon=0.15),
-        TileCodedUCB(['distance'], 5e5, 2)
+        tile_coded_ucb
     ]
 
     debug = False
     if debug:
         run(UCB(),0, 2, False, False, 4*60, False, 0)
     else:
-        with (concurrent.futures.ProcessPoolExecutor(max_workers=min(61, 4 * len(strategies) * args.repetitions))
-              as executor):
-            futures = []
-            for rep_no in range(args.repetitions):
-                for gf in [2]:
-                    for strategy_index, strategy in enumerate(strategies):
-                        futures.append(
-                            executor.submit(
-                                run,
-                                strategy,
-                                rep_no,
-                                growth_factor=gf,
-                                gsl_failures=args.gsl_failures,
-                                isl_failures=args.isl_failures,
-                                max_time_steps=args.max_time_steps,
-                                logging=args.logging,
-                                seed=args.seed + rep_no
-                            )
-                        )
-
-            concurrent.futures.wait(futures)
-
-            for f in concurrent.futures.as_completed(futures):
-                try:
-                    f.result()
-                except Exception as e:
-                    import traceback
-                    print(f"[FAIL] in worker execution: {e}")
-                    traceback.print_exc()
+        # load the trace once, all workers attach to the same shared memory
+        shared_trace = None
+        initializer, initargs = None, ()
+        if args.shared_trace:
+            print("load shared trace")
+            shared_trace = SharedTrace.create(args.max_time_steps, args.trace_dir, steps_per_file=TIME_STEPS_PER_FILE)
+            initializer, initargs = attach_shared_trace, (shared_trace.descriptor(),)
+
+        try:
+            with (concurrent.futures.ProcessPoolExecutor(max_workers=min(61, 4 * len(strategies) * args.repetitions),
+                                                         initializer=initializer, initargs=initargs)
+                  as executor):
+                futures = []
+                for rep_no in range(args.repetitions):
+                    for gf in [2]:
+                        run_args = dict(growth_factor=gf,
+                                        gsl_failures=args.gsl_failures,
+                                        isl_failures=args.isl_failures,
+                                        max_time_steps=args.max_time_steps,
+                                        logging=args.logging,
+                                        logging_fields=(args.logging_fields.split(",")
+                                                        if args.logging_fields is not None else None),
+                                        logging_every=args.logging_every,
+                                        extra_metrics=[name for name in args.extra_metrics.split(",") if name],
+                                        seed=args.seed + rep_no,
+                                        trace_dir=args.trace_dir)
+                        if args.lockstep:
+                            futures.append(executor.submit(run_lockstep, strategies, rep_no, **run_args))
+                        else:
+                            for strategy in strategies:
+                                futures.append(executor.submit(run, strategy, rep_no, **run_args))
+
+                concurrent.futures.wait(futures)
+
+                for f in concurrent.futures.as_completed(futures):
+                    try:
+                        f.result()
+                    except Exception as e:
+                        import traceback
+                        print(f"[FAIL] in worker execution: {e}")
+                        traceback.print_exc()
+        finally:
+            if shared_trace is not None:
+                shared_trace.release()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,47 @@
+import numpy as np
+from src.capacity import GSLModel
+
+
+def pair_distance(network, sat_ids, gs_ids):
+    # same rounding as State.distance_to
+    delta = network.position[gs_ids] - network.position[sat_ids]
+    return np.sqrt(delta[:, 0] ** 2 + delta[:, 1] ** 2 + delta[:, 2] ** 2)
+
+
+# score of every visible (satellite, groundstation) pair, a groundstation connects the satellites of lowest score
+assignment_policies = {
+    "nearest": pair_distance,
+    "elevation": lambda network, sat_ids, gs_ids: -GSLModel.geometry(network, sat_ids, gs_ids)[0]
+}
+
+
+def assign_antennas(network, visible_indptr, visible_indices, antennas, policy="nearest"):
+    # visible groundstations per satellite (CSR) -> GSL connections per satellite (CSR), groundstation ids ascending
+    num_satellites = network.num_satellites
+    gs_ids = visible_indices[visible_indptr[0]:visible_indptr[-1]].astype(np.int64)
+    sat_ids = np.repeat(np.arange(num_satellites), np.diff(visible_indptr))
+    scores = assignment_policies[policy](network, sat_ids, gs_ids)
+
+    # one row per groundstation with the scores of its visible satellites, padded with inf
+    order = np.argsort(gs_ids, kind="stable")
+    counts = np.bincount(gs_ids - num_satellites, minlength=network.num_groundstations)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rows = gs_ids[order] - num_satellites
+    columns = np.arange(len(order)) - starts[rows]
+    width = max(antennas, counts.max(initial=0))
+    score_table = np.full((network.num_groundstations, width), np.inf)
+    score_table[rows, columns] = scores[order]
+    pair_table = np.full((network.num_groundstations, width), -1)
+    pair_table[rows, columns] = order
+
+    # the `antennas` lowest scores of each row, in any order
+    selected = np.argpartition(score_table, antennas - 1, axis=1)[:, :antennas]
+    pairs = np.take_along_axis(pair_table, selected, axis=1).ravel()
+    pairs = pairs[pairs >= 0]
+
+    # sorted by satellite and, within a satellite, by groundstation
+    pairs = pairs[np.lexsort((gs_ids[pairs], sat_ids[pairs]))]
+
+    connected_sats = sat_ids[pairs]
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(connected_sats, minlength=num_satellites))))
+    return indptr, gs_ids[pairs]
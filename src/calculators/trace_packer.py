@@ -0,0 +1,98 @@
+import os
+import sys
+import h5py
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from src.trace import rows_to_csr
+
+# Packs the precomputed hdf5 files into one memory-mapped trace that main.py reads with --trace_dir
+
+data_dir = "../../data"
+trace_dir = "../../data/trace"
+positions_dtype = "float64"  # float32 halves the size of positions.npy
+
+families = {
+    "isl": ("grid/grid_{}.h5", "visibility"),
+    "gsl": ("visibility/groundstation_visibility/satellite_visibility_groundstations_{}.h5", "visibility"),
+    "positions": ("positions/satellite_positions/satellite_positions_{}.h5", "positions"),
+    "data_generation": ("data_generation/satellite_data_generation_{}.h5", "data_generation")
+}
+
+
+def trace_files(file_index):
+    return {name: os.path.join(data_dir, pattern.format(file_index)) for name, (pattern, _) in families.items()}
+
+
+def steps_in_file(file_index):
+    steps = []
+    for name, path in trace_files(file_index).items():
+        with h5py.File(path, 'r') as f:
+            steps.append(f[families[name][1]].shape[0])
+    return min(steps)
+
+
+# find all complete files
+file_steps = []
+while all(os.path.exists(path) for path in trace_files(len(file_steps)).values()):
+    file_steps.append(steps_in_file(len(file_steps)))
+
+num_timepoints = sum(file_steps)
+with h5py.File(trace_files(0)["positions"], 'r') as f:
+    num_satellites = f['positions'].shape[1]
+
+os.makedirs(trace_dir, exist_ok=True)
+positions = np.lib.format.open_memmap(os.path.join(trace_dir, "positions.npy"), mode="w+",
+                                      dtype=positions_dtype, shape=(num_timepoints, num_satellites, 3))
+data_generation = np.lib.format.open_memmap(os.path.join(trace_dir, "data_generation.npy"), mode="w+",
+                                            dtype="float64", shape=(num_timepoints, num_satellites))
+indptr = {}
+raw_indices = {}
+offsets = {}
+for name in ["isl", "gsl"]:
+    indptr[name] = np.lib.format.open_memmap(os.path.join(trace_dir, name + "_indptr.npy"), mode="w+",
+                                             dtype="int64", shape=(num_timepoints, num_satellites + 1))
+    raw_indices[name] = open(os.path.join(trace_dir, name + "_indices.raw"), "wb")
+    offsets[name] = 0
+
+time_counter = 0
+for file_index, num_timepoints_in_file in enumerate(file_steps):
+    files = trace_files(file_index)
+    t0, t1 = time_counter, time_counter + num_timepoints_in_file
+
+    with h5py.File(files["positions"], 'r') as f:
+        positions[t0:t1] = f['positions'][:num_timepoints_in_file]
+    with h5py.File(files["data_generation"], 'r') as f:
+        data_generation[t0:t1] = f['data_generation'][:num_timepoints_in_file]
+
+    for name in ["isl", "gsl"]:
+        with h5py.File(files[name], 'r') as f:
+            rows = f['visibility'][:num_timepoints_in_file]
+        # same layout as the trace reader, the offsets continue those of the previous files
+        file_indptr, file_indices = rows_to_csr(rows)
+        indptr[name][t0:t1] = file_indptr + offsets[name]
+        raw_indices[name].write(file_indices.tobytes())
+        offsets[name] += len(file_indices)
+
+    time_counter = t1
+    print(f"Progress: {time_counter}/{num_timepoints} time points packed.")
+
+# the flat index arrays only have a known length now, copy them into .npy files
+for name in ["isl", "gsl"]:
+    raw_indices[name].close()
+    raw_path = os.path.join(trace_dir, name + "_indices.raw")
+    raw = np.memmap(raw_path, dtype="int32", mode="r", shape=(offsets[name],))
+    indices = np.lib.format.open_memmap(os.path.join(trace_dir, name + "_indices.npy"), mode="w+",
+                                        dtype="int32", shape=(offsets[name],))
+    for start in range(0, offsets[name], 50_000_000):
+        indices[start:start + 50_000_000] = raw[start:start + 50_000_000]
+    indices.flush()
+    del raw, indices
+    os.remove(raw_path)
+
+positions.flush()
+data_generation.flush()
+for name in ["isl", "gsl"]:
+    indptr[name].flush()
+
+print("The packed trace has been successfully saved.")
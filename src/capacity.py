@@ -0,0 +1,106 @@
+import math
+import numpy as np
+
+
+class ISLModel:
+    # Shannon capacity of the optical ISLs over arrays of link distances, the distance-free terms are computed once
+
+    def __init__(self, satellite):
+        self.power = satellite.power
+        self.beam_divergence = satellite.beam_divergence
+        self.pointing_loss = satellite.pointing_loss
+        self.effective_area = np.pi * (satellite.aperture_diameter / 2) ** 2
+        self.noise_power = satellite.k * satellite.noise_temperature * satellite.isl_bandwidth
+        self.upload_bandwidth = 0.08 * satellite.isl_bandwidth  # 0.08 = upload factor
+
+    def capacity(self, distance, failed):
+        received_power_density = self.power / (np.pi * (distance * self.beam_divergence) ** 2)
+        received_power = received_power_density * self.effective_area * self.pointing_loss
+        capacity = self.upload_bandwidth * np.log2(1 + received_power / self.noise_power)
+        return np.where(failed, 1, capacity)
+
+
+class GSLModel:
+    # Satellite.gsl_capacity over arrays of (satellite, groundstation) links, bit-compatible with it for the same
+    # noise draws. The norms are dot products as in np.linalg.norm, the logarithms and powers use the scalar libm
+    # routines, the vectorized numpy loops differ from them in the last bit
+
+    def __init__(self, satellite, num_satellites):
+        self.num_satellites = num_satellites
+        self.atmospheric_attenuation = satellite.atmospheric_attenuation  # [groundstations, elevations]
+        self.elevations = np.arange(satellite.min_elevation, satellite.max_elevation, satellite.step_elevation)
+        self.step_elevation = satellite.step_elevation
+
+        self.speed_of_light = satellite.speed_of_light
+        self.T_mr = satellite.T_mr
+        self.EIRP = satellite.EIRP
+        self.G_rx = satellite.G_rx
+        self.carrier_f = satellite.carrier_f
+        self.gsl_bandwidth = satellite.gsl_bandwidth
+        self.noise_density = satellite.k * satellite.gsl_bandwidth  # W / K
+
+    @staticmethod
+    def geometry(network, src, dst):
+        # elevation in degrees and the satellite-groundstation distance of the [long, lat] vectors
+        gs_long, gs_lat = network.long[dst], network.lat[dst]
+        d_long = network.long[src] - gs_long
+        d_lat = network.lat[src] - gs_lat
+        d = norm(np.stack((d_long, d_lat), axis=1))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            angle = np.arccos((d_long * gs_long + d_lat * gs_lat) / (d * norm(np.stack((gs_long, gs_lat), axis=1))))
+        return 90 - 180 * angle / np.pi, d
+
+    def elevation_index(self, elevation):
+        # nearest grid point and its neighbours, the first of the closest matches argmin over the whole grid
+        nearest = np.rint((elevation - self.elevations[0]) / self.step_elevation)
+        nearest = np.clip(np.where(np.isfinite(nearest), nearest, 0), -1, len(self.elevations)).astype(np.int64)
+        candidates = np.clip(nearest[:, np.newaxis] + np.arange(-1, 2), 0, len(self.elevations) - 1)
+        errors = np.abs(self.elevations[candidates] - elevation[:, np.newaxis])
+        return candidates[np.arange(len(candidates)), np.argmin(errors, axis=1)]
+
+    def capacity(self, elevation, d, dst, failed, noise=None):
+        # per link the attenuation and the noise power factor, drawn in the order of the scalar path
+        if noise is None:
+            noise = np.random.normal(1, (0.05, 0.02), size=(len(dst), 2))
+
+        # atmospheric attenuation
+        A_atmos = self.atmospheric_attenuation[dst - self.num_satellites, self.elevation_index(elevation)]
+        A_atmos = A_atmos * noise[:, 0]
+
+        # free space path loss
+        FSPL = 20 * scalar_map(math.log10, 4 * math.pi * d * self.carrier_f * 1e9 / self.speed_of_light)  # db
+
+        # noise
+        attenuation = scalar_map(lambda x: 10 ** x, -A_atmos / 10)
+        T_sky = self.T_mr * (1 - attenuation) + 2.7 * attenuation
+        P_noise = self.noise_density * T_sky * noise[:, 1]  # W
+
+        # total receiver power
+        P_rx = scalar_map(lambda x: 10 ** x, (self.EIRP - FSPL + self.G_rx - A_atmos) / 10)  # W
+
+        # Shannon-Hartley
+        capacity = self.gsl_bandwidth * scalar_map(math.log2, 1 + P_rx / P_noise)
+        return np.where(failed, 1, capacity)
+
+
+def check_gsl_model(satellites, groundstations, links, random_state):
+    # recomputes the GSL capacities of a link table with the scalar Satellite.gsl_capacity from the random state the
+    # table drew its noise from. Returns the number of GSLs and of those whose capacities differ, the random state
+    # is left as it was
+    state = np.random.get_state()
+    np.random.set_state(random_state)
+    reference = np.array([satellites[src].gsl_capacity(groundstations[dst - len(satellites)], satellites)
+                          for src, dst in zip(links.src[links.num_isls:], links.dst[links.num_isls:])], dtype=float)
+    np.random.set_state(state)
+    capacity = links.capacity[links.num_isls:]
+    return len(capacity), int(np.sum((reference != capacity) & ~(np.isnan(reference) & np.isnan(capacity))))
+
+
+def norm(vectors):
+    # euclidean norm of every row as the dot product np.linalg.norm takes for a single vector
+    return np.sqrt(np.matmul(vectors[:, np.newaxis, :], vectors[:, :, np.newaxis])[:, 0, 0])
+
+
+def scalar_map(function, values):
+    # function applied to every element as a numpy scalar, with the results of the scalar code
+    return np.array([function(value) for value in values], dtype=float)
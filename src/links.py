@@ -0,0 +1,99 @@
+import itertools
+import numpy as np
+from src.capacity import GSLModel, ISLModel
+
+
+class LinkGeometry:
+    # every ISL and GSL of one step with everything about them that does not depend on failures or noise, built once
+    # per step and shared by the link tables of all network copies. ISLs come first, the ISLs of satellite i are
+    # isl_indptr[i]:isl_indptr[i + 1], its GSLs gsl_indptr[i]:gsl_indptr[i + 1]
+    isl_model: ISLModel
+
+    def __init__(self, satellites):
+        network = satellites[0].network
+        num_satellites = len(satellites)
+        sat_ids = np.arange(num_satellites)
+
+        isl_counts = np.fromiter((len(sat.ISL_connections) for sat in satellites), dtype=np.int64, count=num_satellites)
+        gsl_counts = np.fromiter((len(sat.GSL_connections) for sat in satellites), dtype=np.int64, count=num_satellites)
+        self.isl_indptr = np.concatenate(([0], np.cumsum(isl_counts)))
+        self.gsl_indptr = self.isl_indptr[-1] + np.concatenate(([0], np.cumsum(gsl_counts)))
+        self.num_isls = int(self.isl_indptr[-1])
+
+        self.src = np.concatenate((np.repeat(sat_ids, isl_counts), np.repeat(sat_ids, gsl_counts)))
+        connections = itertools.chain(itertools.chain.from_iterable(sat.ISL_connections for sat in satellites),
+                                      itertools.chain.from_iterable(sat.GSL_connections for sat in satellites))
+        self.dst = np.fromiter(connections, dtype=np.int64, count=len(self.src))
+        self.is_gsl = np.arange(len(self.src)) >= self.num_isls
+
+        # euclidean distance in m, same rounding as State.distance_to
+        delta = network.position[self.src] - network.position[self.dst]
+        self.distance = np.sqrt(delta[:, 0] ** 2 + delta[:, 1] ** 2 + delta[:, 2] ** 2)
+
+        # elevation of the satellite seen from the groundstation in degrees, nan for ISLs, and the distance of their
+        # [long, lat] vectors the GSL model takes
+        gsl = self.is_gsl
+        self.elevation = np.full(len(self.src), np.nan)
+        self.elevation[gsl], self.gsl_distance = GSLModel.geometry(network, self.src[gsl], self.dst[gsl])
+
+        # ISL capacities without failures
+        self.isl_capacity = self.isl_model.capacity(self.distance[~gsl], False)
+
+        self.index = dict(zip(zip(self.src.tolist(), self.dst.tolist()), range(len(self.src))))
+
+
+class LinkTable:
+    # the links of a LinkGeometry with the capacities of one network copy: its failed links have capacity 1 and
+    # every GSL gets its own noise draws. Read by the strategies, the paket manager and the buffers
+    gsl_model: GSLModel
+
+    def __init__(self, satellites, groundstations, geometry=None):
+        if geometry is None:
+            geometry = LinkGeometry(satellites)
+        self.geometry = geometry
+        self.isl_indptr = geometry.isl_indptr
+        self.gsl_indptr = geometry.gsl_indptr
+        self.num_isls = geometry.num_isls
+        self.src = geometry.src
+        self.dst = geometry.dst
+        self.is_gsl = geometry.is_gsl
+        self.distance = geometry.distance
+        self.elevation = geometry.elevation
+        self.index = geometry.index
+
+        # one capacity (and one noise draw per GSL) per link and step
+        self.capacity = np.empty(len(self.src))
+        gsl = self.is_gsl
+        isl = ~gsl
+        failed_isl = np.fromiter((sat.failed_isl for sat in satellites), dtype=bool, count=len(satellites))
+        self.capacity[isl] = np.where(failed_isl[self.src[isl]], 1, geometry.isl_capacity)
+        failed = np.array([sat.failed_gsl for sat in satellites] + [gs.failed for gs in groundstations])
+        self.capacity[gsl] = self.gsl_model.capacity(self.elevation[gsl], geometry.gsl_distance, self.dst[gsl],
+                                                     failed[self.src[gsl]] | failed[self.dst[gsl]])
+
+    def neighbour_table(self):
+        # targets of every satellite as an [N, max_neighbours] table padded with -1, its ISLs before its GSLs as in
+        # ISL_connections + GSL_connections, and the number of targets per satellite
+        num_satellites = len(self.isl_indptr) - 1
+        order = np.argsort(self.src, kind="stable")
+        src = self.src[order]
+        counts = np.bincount(src, minlength=num_satellites)
+        rank = np.arange(len(src)) - (np.cumsum(counts) - counts)[src]
+        table = np.full((num_satellites, max(counts.max(initial=0), 1)), -1)
+        table[src, rank] = self.dst[order]
+        return table, counts
+
+    def isls(self, sat_id):
+        return slice(self.isl_indptr[sat_id], self.isl_indptr[sat_id + 1])
+
+    def gsls(self, sat_id):
+        return slice(self.gsl_indptr[sat_id], self.gsl_indptr[sat_id + 1])
+
+    def find(self, src, dst):
+        return self.index[(int(src), int(dst))]
+
+    def distance_of(self, src, dst):
+        return self.distance[self.find(src, dst)]
+
+    def capacity_of(self, src, dst):
+        return self.capacity[self.find(src, dst)]
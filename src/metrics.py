@@ -0,0 +1,110 @@
+import numpy as np
+
+# name -> function(context) of every metric that can be written to the results file
+metrics = {}
+
+default_metrics = ["avg_delay", "drop_rate", "cost", "generation_rate", "throughput", "avg_hops", "main_link_out"]
+
+
+def metric(name):
+    def register(function):
+        metrics[name] = function
+        return function
+    return register
+
+
+class MetricContext:
+    # per-node and per-link arrays of one evaluated step, shared by all metrics
+
+    def __init__(self, network_state, link_src, link_dst, link_traffic, link_rank, average_hops):
+        n = network_state.num_satellites
+        num_nodes = n + network_state.num_groundstations
+
+        self.num_satellites = n
+        self.generation_rate = network_state.generation_rate[:n]
+        self.drop_rate = network_state.drop_rate[:n]
+        self.delay = network_state.delay[:n]
+        self.cost = network_state.cost[:n]
+        self.delivered = self.generation_rate * (1 - self.drop_rate)
+        self.total_generation_rate = self.generation_rate.sum()
+
+        # link_rank is the position of the link's target in target_ids of its source, 0 is the main link
+        self.outgoing_traffic = np.bincount(link_src, weights=link_traffic, minlength=num_nodes)
+        self.incoming_traffic = np.bincount(link_dst, weights=link_traffic, minlength=num_nodes)
+        self.main_link_traffic = np.bincount(link_src[link_rank == 0], weights=link_traffic[link_rank == 0],
+                                             minlength=num_nodes)
+        self.average_hops = average_hops
+
+
+def compute_metrics(context, names=None):
+    return {name: metrics[name](context) for name in (default_metrics if names is None else names)}
+
+
+@metric("avg_delay")
+def average_delay(c):
+    return (c.delivered * c.delay).sum() / c.delivered.sum()
+
+
+@metric("drop_rate")
+def drop_rate(c):
+    return (c.generation_rate * c.drop_rate).sum() / c.total_generation_rate
+
+
+@metric("cost")
+def cost(c):
+    return (c.generation_rate * c.cost).sum() / c.total_generation_rate
+
+
+@metric("generation_rate")
+def generation_rate(c):
+    return c.total_generation_rate
+
+
+@metric("throughput")
+def throughput(c):
+    return (1 - drop_rate(c)) * c.total_generation_rate
+
+
+@metric("avg_hops")
+def average_hops(c):
+    return c.average_hops
+
+
+@metric("main_link_out")
+def main_link_out_share(c):
+    sending = c.outgoing_traffic[:c.num_satellites] > 0
+    return np.mean(c.main_link_traffic[:c.num_satellites][sending] / c.outgoing_traffic[:c.num_satellites][sending])
+
+
+@metric("gs_load_max")
+def groundstation_load_max(c):
+    return c.incoming_traffic[c.num_satellites:].max()
+
+
+@metric("gs_load_mean")
+def groundstation_load_mean(c):
+    return c.incoming_traffic[c.num_satellites:].mean()
+
+
+def delay_percentile(c, q):
+    # delay below which q percent of the delivered traffic arrives
+    order = np.argsort(c.delay)
+    weights = np.cumsum(c.delivered[order])
+    if weights[-1] <= 0:
+        return np.nan
+    return c.delay[order][np.searchsorted(weights, q / 100 * weights[-1])]
+
+
+@metric("delay_p50")
+def delay_p50(c):
+    return delay_percentile(c, 50)
+
+
+@metric("delay_p95")
+def delay_p95(c):
+    return delay_percentile(c, 95)
+
+
+@metric("delay_p99")
+def delay_p99(c):
+    return delay_percentile(c, 99)
@@ -1,204 +1,305 @@
-import copy
 from collections import deque
+import numpy as np
+from src.metrics import MetricContext, compute_metrics
+from src.paths import PathTree
 
 
 class PaketManager:
 
-    def __init__(self, satellites, groundstations):
+    def __init__(self, satellites, groundstations, absolute_tolerance=1, relative_tolerance=1e-6,
+                 max_sweeps=100, max_stream_updates=100000, drain_groundstations=False):
         self.satellites = satellites
         self.groundstations = groundstations
+        self.nodes = satellites + groundstations
+
+        # update_streams works in sweeps over the queued nodes and stops once the traffic change of a sweep is at
+        # most absolute_tolerance (bit/s) + relative_tolerance * total generation rate, after max_sweeps, or once
+        # more than max_stream_updates streams were forwarded (the number of paths can grow exponentially)
+        self.absolute_tolerance = absolute_tolerance
+        self.relative_tolerance = relative_tolerance
+        self.max_sweeps = max_sweeps
+        self.max_stream_updates = max_stream_updates
+        # drain_groundstations=True lets the groundstations still in the queue forward what reached them to the core
+        # once propagation stops, otherwise the queue is left as it is
+        self.drain_groundstations = drain_groundstations
+        self.diagnostics = {"iterations": 0, "residual": 0, "truncated": False}
+
+        # Evaluation of the last set_rewards, the one written to the nodes
+        self.evaluation = None
 
         self.TTL = 200  # 1000  # (60000) in ms
         self.max_number_of_groundstation_connections = 1000
         self.speed_of_light = 299792.458  # m / ms
 
-    def set_rewards(self):
-
-        # backup actions
-        actions = {}
-        for s in self.satellites:
-            actions[s] = copy.deepcopy(s.target_ids)
-
-        # set new update indicators
-        for s in self.satellites:
-            s.buffer_was_updated = 0
-            s.traffic_left = 0
-            s.delay_was_updated = False
-            s.drop_rate_was_updated = False
-
-        for gs in self.groundstations:
-            gs.drop_rate_was_updated = False
+        # paths of all streams of the current step, a stream is [path id, traffic]
+        self.paths = PathTree()
+
+        # tables of the link table of the current step, shared by every target table evaluated in it
+        self.step_links = None
+        self.link_capacities = {}
+        self.propagation_delays = {}
+        self.buffer_size = np.array([node.buffer_size for node in self.nodes])
+
+    def set_rewards(self, targets=None):
+        # evaluates the step for the targets the strategy set and writes the results to the nodes
+        self.commit(self.evaluate(targets))
+
+    def evaluate(self, targets=None, tables=None):
+        # evaluates the step for a target table, the target ids of every satellite (by default the ones the strategy
+        # set). Neither the table nor the nodes are written, every result is kept in the returned Evaluation.
+        # tables are the QueuingTables of the step if they are already built
+        links = self.satellites[0].network.links
+        self.prepare_step(links)
+        tables = QueuingTables(self) if tables is None else tables
+        targets = [sat.target_ids for sat in self.satellites] if targets is None else targets
+        throughputs = [{target: max(self.link_capacities[(sat.id, int(target))], 0)
+                        for target in targets[sat.id]} for sat in self.satellites]
+        evaluation = Evaluation(self.satellites[0].network, targets, throughputs)
 
         # update streams
-        self.update_streams()
+        evaluation.diagnostics = self.update_streams(evaluation, tables)
 
-        # update buffers
-        for sat in self.satellites:
-            sat.update_buffer(self.satellites, self.groundstations)
+        # traffic per node of this evaluation
+        evaluation.incoming_traffic = np.array([sum(sum(s[1] for s in ss) for ss in streams.values())
+                                                for streams in evaluation.incoming_streams])
+        evaluation.outgoing_traffic = np.array([sum(s[1] for ss in streams.values() for s in ss)
+                                                for streams in evaluation.outgoing_streams])
 
-        for gs in self.groundstations:
-            gs.update_buffer()
+        # update buffers
+        self.update_buffers(evaluation, tables)
 
         # update drop rates
-        self.update_drop_rates()
+        self.update_drop_rates(evaluation)
 
         # update local drop rates
-        for sat in self.satellites:
-            self.update_local_drop_rate(sat)
+        self.update_local_drop_rates(evaluation)
 
         # update delays
-        for gs in self.groundstations:
-            gs.update_delay()
-
-        self.update_delays()
-
-        # set costs
-        for s in self.satellites:
-            if s.delay >= self.TTL:
-                s.drop_rate = 1
-                s.delay = self.TTL
-            s.cost = s.drop_rate * self.TTL + (1 - s.drop_rate) * s.delay
-
-        # reinstantiate actions
-        for s in self.satellites:
-            s.target_ids = actions[s]
+        buffer_level = evaluation.buffer_level
+        with np.errstate(invalid="ignore", divide="ignore"):
+            evaluation.queuing_delays = np.where((buffer_level > 0) & (evaluation.outgoing_traffic > 0),
+                                                 buffer_level / evaluation.outgoing_traffic, 0)
 
-    def update_streams(self):
+        gss = slice(len(self.satellites), len(self.nodes))
+        evaluation.delay[gss] = tables.base_delay + buffer_level[gss] / tables.groundstation_throughput
 
-        # set incoming and outgoing traffic to 0
-        for s in self.satellites:
-            s.drop_rate = 0
-            s.incoming_streams = {}
-            s.outgoing_streams = {}
-            s.drops_per_link = []
+        self.update_delays(evaluation)
 
-        for gs in self.groundstations:
-            gs.drop_rate = 0
-            gs.incoming_streams = {}
-            gs.outgoing_streams = {}
+        # set costs
+        sats = slice(0, len(self.satellites))
+        drop_rate, delay = evaluation.drop_rate[sats], evaluation.delay[sats]
+        expired = delay >= self.TTL
+        drop_rate[expired] = 1
+        delay[expired] = self.TTL
+        evaluation.cost[sats] = drop_rate * self.TTL + (1 - drop_rate) * delay
+        return evaluation
+
+    def commit(self, evaluation):
+        # writes an evaluation to the NetworkState and the nodes, where the strategies and the telemetry read it
+        network = self.satellites[0].network
+        network.buffer_level[:] = evaluation.buffer_level
+        network.drop_rate[:] = evaluation.drop_rate
+        network.delay[:] = evaluation.delay
+        network.cost[:] = evaluation.cost
+
+        for node in self.nodes:
+            node.incoming_streams = evaluation.incoming_streams[node.id]
+            node.outgoing_streams = evaluation.outgoing_streams[node.id]
+        for sat in self.satellites:
+            sat.local_drop_rate = evaluation.local_drop_rate[sat.id]
+            sat.incoming_data = evaluation.incoming_data[sat.id]
+            sat.delays_per_outgoing_link = evaluation.delays_per_outgoing_link[sat.id]
+
+        self.evaluation = evaluation
+        self.diagnostics = evaluation.diagnostics
+
+    def prepare_step(self, links):
+        if self.step_links is not links:
+            self.step_links = links
+            self.link_capacities = dict(zip(links.index, links.capacity.tolist()))
+            self.propagation_delays = dict(zip(links.index, (links.distance / self.speed_of_light).tolist()))
+
+            # the paths of one step are shared by all its evaluations
+            self.paths.clear()
+
+    def evaluate_batch(self, candidate_target_tables, metric_names=None):
+        # scores alternative target tables against the topology and traffic of the current step, e.g. for policy
+        # search or oracle baselines. Returns the metrics of every table and the cost of every satellite per table,
+        # nothing is committed
+        self.prepare_step(self.satellites[0].network.links)
+        tables = QueuingTables(self)
+        results = []
+        costs = np.zeros((len(candidate_target_tables), len(self.satellites)))
+        for i, targets in enumerate(candidate_target_tables):
+            evaluation = self.evaluate(targets, tables)
+            context = MetricContext(evaluation, *self.get_link_traffic(evaluation), self.get_average_hops(evaluation))
+            results.append(compute_metrics(context, metric_names))
+            costs[i] = evaluation.cost[:len(self.satellites)]
+
+        return results, costs
+
+    def update_streams(self, evaluation, tables):
+        incoming_streams = evaluation.incoming_streams
+        outgoing_streams = evaluation.outgoing_streams
+        groundstation_throughput = tables.groundstation_throughput.tolist()
 
         # fill outgoing links
-        for sat in self.satellites:
-            if sat.generation_rate > 0:
-                sat.incoming_streams["generation"] = [[[sat.id], sat.generation_rate]]
+        for sat_id, path, generation_rate in tables.generation:
+            incoming_streams[sat_id]["generation"] = [[path, generation_rate]]
 
         queue = deque([s.id for s in self.satellites])
-        kill_counter = 0
+        in_queue = [True] * len(self.satellites) + [False] * len(self.groundstations)
+        tolerance = tables.tolerance
+
+        # a sweep processes the nodes queued by the previous one, its residual is the summed traffic change
+        sweeps = 0
+        stream_updates = 0
+        sweep_left = len(queue)
+        sweep_residual = 0
+        residual = 0
+        stopped = False
+        truncated = False
 
         while len(queue) > 0:
-            if kill_counter > 100000:
-                break
+            if not stopped and (sweep_left == 0 or stream_updates > self.max_stream_updates):
+                sweeps += 1
+                residual, sweep_residual = sweep_residual, 0
+                sweep_left = len(queue)
+                truncated = stream_updates > self.max_stream_updates or (residual > tolerance and
+                                                                         sweeps >= self.max_sweeps)
+                if truncated or residual <= tolerance:
+                    stopped = True
+                    if not self.drain_groundstations:
+                        break
+                    queue = deque(nodeID for nodeID in queue if nodeID >= len(self.satellites))
+                    continue
 
             nodeID = queue.popleft()
+            in_queue[nodeID] = False
+            sweep_left -= 1
 
-            if nodeID < len(self.satellites):
-                node = self.satellites[nodeID]
-            else:
-                node = self.groundstations[nodeID - len(self.satellites)]
-
-            remaining_streams = []
-            for incoming_node in node.incoming_streams:
-                remaining_streams += node.incoming_streams[incoming_node]
+            # remaining streams as path ids and traffic, addressed by index
+            stream_paths = []
+            stream_traffic = []
+            for incoming_node in incoming_streams[nodeID]:
+                for stream in incoming_streams[nodeID][incoming_node]:
+                    stream_paths.append(stream[0])
+                    stream_traffic.append(stream[1])
 
             if nodeID < len(self.satellites):
-                for target in node.target_ids:
-                    if target < len(self.satellites):
-                        target_node = self.satellites[target]
-                    else:
-                        target_node = self.groundstations[target - len(self.satellites)]
+                for target in evaluation.targets[nodeID]:
+                    target_streams = incoming_streams[target]
 
-                    if nodeID in target_node.incoming_streams:
-                        old_streams = target_node.incoming_streams[nodeID]
+                    if nodeID in target_streams:
+                        old_streams = target_streams[nodeID]
                     else:
                         old_streams = []
 
-                    if len(remaining_streams) > 0:
-                        target_outgoing_streams = [stream for stream in remaining_streams if target not in stream[0]]
-                        remaining_traffic = sum(stream[1] for stream in target_outgoing_streams)
+                    if len(stream_paths) > 0:
+                        outgoing = [not self.paths.visits(path, target) for path in stream_paths]
+                        remaining_traffic = sum(traffic for traffic, out in zip(stream_traffic, outgoing) if out)
 
                         if remaining_traffic == 0:
                             break
 
-                        if target >= len(self.satellites):
-                            capacity = 0.9 * node.gsl_capacity(self.groundstations[target - len(self.satellites)],
-                                                               self.satellites)
-                        else:
-                            capacity = 0.9 * node.isl_capacity(node.state.distance_to(self.satellites[target].state))
+                        capacity = 0.9 * self.link_capacities[(nodeID, int(target))]
 
-                        link_capacity = node.outgoing_throughputs[target]
+                        link_capacity = evaluation.throughputs[nodeID][target]
                         new_traffic = min(min(link_capacity, capacity), remaining_traffic)
                         share_transmitted_new_traffic = new_traffic / remaining_traffic
                         share_cc_estimate = min(1, capacity / remaining_traffic)
 
-                        new_streams = []
-                        for out_stream in target_outgoing_streams:
-                            kill_counter += 1
-                            new_streams.append(
-                                [out_stream[0] + [target], share_transmitted_new_traffic * out_stream[1]])
-                            remaining_streams.remove(out_stream)
-                            if share_cc_estimate < 1:
-                                remaining_streams.append([out_stream[0], (1 - share_cc_estimate) * out_stream[1]])
+                        new_streams = [[self.paths.extend(path, target), share_transmitted_new_traffic * traffic]
+                                       for path, traffic, out in zip(stream_paths, stream_traffic, outgoing) if out]
+                        sweep_residual += stream_change(old_streams, new_streams)
+                        stream_updates += len(new_streams)
+
+                        # the forwarded streams leave, the part the target may not take goes to the back
+                        kept_paths = [path for path, out in zip(stream_paths, outgoing) if not out]
+                        kept_traffic = [traffic for traffic, out in zip(stream_traffic, outgoing) if not out]
+                        if share_cc_estimate < 1:
+                            kept_paths += [path for path, out in zip(stream_paths, outgoing) if out]
+                            kept_traffic += [(1 - share_cc_estimate) * traffic
+                                             for traffic, out in zip(stream_traffic, outgoing) if out]
+                        stream_paths, stream_traffic = kept_paths, kept_traffic
 
-                        target_node.incoming_streams[nodeID] = new_streams
-                        node.outgoing_streams[target] = new_streams
+                        target_streams[nodeID] = new_streams
+                        outgoing_streams[nodeID][target] = new_streams
 
-                        if new_streams != old_streams and new_traffic >= 1 and target not in queue:
+                        if new_streams != old_streams and new_traffic >= 1 and not in_queue[target]:
                             queue.append(target)
+                            in_queue[target] = True
 
             else:
-                remaining_traffic = sum(stream[1] for stream in remaining_streams)
-                new_traffic = min(node.outgoing_throughput, remaining_traffic)
+                remaining_traffic = sum(stream_traffic)
+                new_traffic = min(groundstation_throughput[nodeID - len(self.satellites)], remaining_traffic)
                 new_streams = []
-                for out_stream in remaining_streams:
+                for path, traffic in zip(stream_paths, stream_traffic):
                     share = new_traffic / remaining_traffic
-                    new_streams.append([out_stream[0] + ["core"], share * out_stream[1]])
-                node.outgoing_streams["core"] = new_streams
+                    new_streams.append([self.paths.extend(path, PathTree.CORE), share * traffic])
+                outgoing_streams[nodeID]["core"] = new_streams
 
-    def update_drop_rates(self):
+        if not stopped:
+            sweeps += 1
+            residual = sweep_residual
+        return {"iterations": sweeps, "residual": residual, "truncated": truncated}
+
+    def update_drop_rates(self, evaluation):
 
         delivered_rates_pre_satellite = {sat.id: 0 for sat in self.satellites}
         for gs in self.groundstations:
-            if "core" in gs.outgoing_streams:
-                for stream in gs.outgoing_streams["core"]:
-                    delivered_rates_pre_satellite[stream[0][0]] += stream[1]
+            if "core" in evaluation.outgoing_streams[gs.id]:
+                for stream in evaluation.outgoing_streams[gs.id]["core"]:
+                    delivered_rates_pre_satellite[self.paths.origin[stream[0]]] += stream[1]
 
         for satellite in self.satellites:
-            if "generation" in satellite.incoming_streams:
-                generation_rate = satellite.incoming_streams["generation"][0][1]
+            incoming_streams = evaluation.incoming_streams[satellite.id]
+            if "generation" in incoming_streams:
+                generation_rate = incoming_streams["generation"][0][1]
             else:
                 generation_rate = 0
 
-            satellite.drop_rate = 0 if generation_rate == 0 else (1 - delivered_rates_pre_satellite[satellite.id] /
-                                                                  generation_rate)
+            evaluation.drop_rate[satellite.id] = 0 if generation_rate == 0 else (
+                1 - delivered_rates_pre_satellite[satellite.id] / generation_rate)
+
+    def update_buffers(self, evaluation, tables):
+        # a node fills its buffer once its outgoing traffic reaches what its links can carry
+        throughputs = evaluation.throughputs
+        outgoing_capacity = [sum(min(throughputs[sat.id][target], self.link_capacities[(sat.id, int(target))])
+                                 for target in evaluation.targets[sat.id]) for sat in self.satellites]
+        outgoing_capacity += tables.groundstation_throughput.tolist()
+        evaluation.buffer_level[:] = np.where(evaluation.outgoing_traffic >= np.array(outgoing_capacity),
+                                              self.buffer_size, 0)
 
-    @staticmethod
-    def update_local_drop_rate(satellite):
+    def update_local_drop_rates(self, evaluation):
+        for satellite in self.satellites:
+            incoming_data = evaluation.incoming_traffic[satellite.id]
+            if incoming_data > 0:
+                evaluation.local_drop_rate[satellite.id] = 1 - evaluation.outgoing_traffic[satellite.id] / incoming_data
+            else:
+                evaluation.local_drop_rate[satellite.id] = 0
 
-        incoming_data = sum(list(map(lambda all_streams_from_source: sum(list(map(lambda stream: stream[1],
-                                                                                  all_streams_from_source))),
-                                     satellite.incoming_streams.values())))
-        if incoming_data > 0:
-            outgoing_data = sum(list(map(lambda all_streams_to_target: sum(list(map(lambda stream: stream[1],
-                                                                                    all_streams_to_target))),
-                                         satellite.outgoing_streams.values())))
-            satellite.local_drop_rate = 1 - outgoing_data / incoming_data
-        else:
-            satellite.local_drop_rate = 0
+            evaluation.incoming_data[satellite.id] = incoming_data
 
-        satellite.incoming_data = incoming_data
+    def update_delays(self, evaluation):
 
-    def update_delays(self):
+        # with the queuing delay of every node and the propagation delay of every link, the delay of a path is summed
+        # once per interned path from the delay of the path it extends
+        propagation_delays = self.propagation_delays
+        queuing_delays = evaluation.queuing_delays.tolist()
+        path_delays = {}
 
         streams_per_satellite = {sat.id: [] for sat in self.satellites}
         for gs in self.groundstations:
-            if "core" in gs.outgoing_streams:
-                for stream in gs.outgoing_streams["core"]:
-                    if stream[0][0] in streams_per_satellite:
-                        streams_per_satellite[stream[0][0]].append(stream)
+            if "core" in evaluation.outgoing_streams[gs.id]:
+                for stream in evaluation.outgoing_streams[gs.id]["core"]:
+                    if self.paths.origin[stream[0]] in streams_per_satellite:
+                        streams_per_satellite[self.paths.origin[stream[0]]].append(stream)
 
         for satellite in self.satellites:
-            if "generation" in satellite.incoming_streams:
-                generation_rate = satellite.incoming_streams["generation"][0][1]
+            incoming_streams = evaluation.incoming_streams[satellite.id]
+            if "generation" in incoming_streams:
+                generation_rate = incoming_streams["generation"][0][1]
             else:
                 generation_rate = 0
 
@@ -207,76 +308,138 @@ class PaketManager:
             for stream in streams_per_satellite[satellite.id]:
                 path = stream[0]
                 traffic = stream[1]
-                stream_delay = 0
 
-                if path[-1] == "core":
-                    for nodeID in path[:-1]:
-                        if nodeID < len(self.satellites):
-                            current_node = self.satellites[nodeID]
-                        else:
-                            current_node = self.groundstations[nodeID - len(self.satellites)]
-
-                        if current_node.buffer_level > 0:
-                            outgoing_traffic = sum(s[1] for ss in current_node.outgoing_streams.values() for s in ss)
-                            queuing_delay = current_node.buffer_level / outgoing_traffic if outgoing_traffic > 0 else 0
-                        else:
-                            queuing_delay = 0
-
-                        stream_delay += queuing_delay
-
-                    for i in range(len(path) - 2):
-                        current = path[i]
-                        target = path[i + 1]
-
-                        if current < len(self.satellites):
-                            current_node = self.satellites[current]
-                        else:
-                            current_node = self.groundstations[current - len(self.satellites)]
-
-                        if target < len(self.satellites):
-                            target_node = self.satellites[target]
-                        else:
-                            target_node = self.groundstations[target - len(self.satellites)]
-
-                        dist = current_node.state.distance_to(target_node.state)
-
-                        stream_delay += dist / self.speed_of_light
+                if self.paths.node[path] == PathTree.CORE:
+                    stream_delay = self.path_delay(self.paths.parent[path], queuing_delays, propagation_delays,
+                                                   path_delays)
                 else:
                     stream_delay = self.TTL
 
-                outgoing_link = stream[0][1]
+                outgoing_link = self.second_node(path)
                 if outgoing_link not in streams_per_outgoing_link:
-                    streams_per_outgoing_link[outgoing_link] = []
+                    streams_per_outgoing_link[outgoing_link] = [0, 0]
 
-                streams_per_outgoing_link[outgoing_link].append([traffic, stream_delay])
+                streams_per_outgoing_link[outgoing_link][0] += traffic * stream_delay
+                streams_per_outgoing_link[outgoing_link][1] += traffic
 
                 delay += (traffic * stream_delay) / generation_rate if generation_rate > 0 else 0
 
             delays_per_outgoing_link = {}
-            for outgoing_link in satellite.target_ids:
+            for outgoing_link in evaluation.targets[satellite.id]:
                 if outgoing_link in streams_per_outgoing_link:
-                    total_weighted_delay = sum(
-                        traffic * delay for traffic, delay in streams_per_outgoing_link[outgoing_link])
-                    total_traffic = sum(traffic for traffic, delay in streams_per_outgoing_link[outgoing_link])
+                    total_weighted_delay, total_traffic = streams_per_outgoing_link[outgoing_link]
                     delays_per_outgoing_link[outgoing_link] = total_weighted_delay / total_traffic
                 else:
                     delays_per_outgoing_link[outgoing_link] = self.TTL
 
-            satellite.delay = delay
-            satellite.delays_per_outgoing_link = delays_per_outgoing_link
-
-    def get_average_hops(self):
+            evaluation.delay[satellite.id] = delay
+            evaluation.delays_per_outgoing_link[satellite.id] = delays_per_outgoing_link
+
+    def path_delay(self, path, queuing_delays, propagation_delays, path_delays):
+        # queuing delay of every node of the path plus the propagation delay of every hop, memoised per path
+        unknown = []
+        while path >= 0 and path not in path_delays:
+            unknown.append(path)
+            path = self.paths.parent[path]
+
+        delay = path_delays.get(path, 0)
+        for path in reversed(unknown):
+            node = self.paths.node[path]
+            parent = self.paths.parent[path]
+            if parent >= 0:
+                delay += propagation_delays[(self.paths.node[parent], node)]
+            delay += queuing_delays[node]
+            path_delays[path] = delay
+        return delay
+
+    def second_node(self, path):
+        # first hop of a path, the outgoing link of its origin
+        while self.paths.length[path] > 2:
+            path = self.paths.parent[path]
+        return self.paths.node[path]
+
+    def get_average_hops(self, evaluation=None):
+        # of the last set_rewards by default
+        evaluation = self.evaluation if evaluation is None else evaluation
 
         delivered_rate = 0
         weighted_hops = 0
         for gs in self.groundstations:
-            if "core" in gs.outgoing_streams:
-                streams = gs.outgoing_streams["core"]
+            if "core" in evaluation.outgoing_streams[gs.id]:
+                streams = evaluation.outgoing_streams[gs.id]["core"]
                 if len(streams) > 0:
-                    weighted_hops += sum(map(lambda s: (len(s[0]) - 2) * s[1], streams))
+                    weighted_hops += sum(map(lambda s: (self.paths.length[s[0]] - 2) * s[1], streams))
                     delivered_rate += sum(map(lambda s: s[1], streams))
 
         if delivered_rate > 0:
             return weighted_hops / delivered_rate
 
-        return 0
+        return 0.0
+
+    def get_link_traffic(self, evaluation=None):
+        # src, dst and traffic of every satellite link carrying streams, rank is the position of dst in its targets,
+        # of the last set_rewards by default
+        evaluation = self.evaluation if evaluation is None else evaluation
+        links = [(sat.id, target, sum(stream[1] for stream in streams), list(evaluation.targets[sat.id]).index(target))
+                 for sat in self.satellites for target, streams in evaluation.outgoing_streams[sat.id].items()]
+        links = np.array(links, dtype=float).reshape(-1, 4)
+        return links[:, 0].astype(int), links[:, 1].astype(int), links[:, 2], links[:, 3].astype(int)
+
+
+class QueuingTables:
+    # per-node inputs of the streams, buffers and queuing delays that do not depend on the target table, shared by
+    # all tables evaluated against the same step
+
+    def __init__(self, paket_manager):
+        satellites = paket_manager.satellites
+
+        # the generation stream of every sending satellite, its path starts a path tree of the step
+        self.generation = [(sat.id, paket_manager.paths.root(sat.id), sat.generation_rate)
+                           for sat in satellites if sat.generation_rate > 0]
+        self.tolerance = (paket_manager.absolute_tolerance +
+                          paket_manager.relative_tolerance * sum(s.generation_rate for s in satellites))
+
+        self.groundstation_throughput = np.array([gs.outgoing_throughput for gs in paket_manager.groundstations])
+        self.base_delay = np.array([gs.base_delay for gs in paket_manager.groundstations])
+
+
+class Evaluation:
+    # results of evaluating one target table in a step, written to the nodes by PaketManager.commit. It has the
+    # per-node columns MetricContext reads from a NetworkState
+
+    def __init__(self, network, targets, throughputs):
+        self.num_satellites = network.num_satellites
+        self.num_groundstations = network.num_groundstations
+        num_nodes = self.num_satellites + self.num_groundstations
+
+        # the evaluated target table and the usable rate of each of its links
+        self.targets = targets
+        self.throughputs = throughputs
+        self.diagnostics = None
+
+        # streams per node id, in the format of node.incoming_streams
+        self.incoming_streams = [{} for _ in range(num_nodes)]
+        self.outgoing_streams = [{} for _ in range(num_nodes)]
+
+        self.generation_rate = network.generation_rate
+        self.incoming_traffic = np.zeros(num_nodes)
+        self.outgoing_traffic = np.zeros(num_nodes)
+        self.buffer_level = np.zeros(num_nodes)
+        self.queuing_delays = np.zeros(num_nodes)
+        self.drop_rate = np.zeros(num_nodes)
+        self.delay = np.zeros(num_nodes)
+        self.cost = np.zeros(num_nodes)
+
+        # per satellite
+        self.local_drop_rate = [0] * self.num_satellites
+        self.incoming_data = [0] * self.num_satellites
+        self.delays_per_outgoing_link = [{} for _ in range(self.num_satellites)]
+
+
+def stream_change(old_streams, new_streams):
+    # summed absolute traffic change per path between two stream lists of a link
+    old = {path: traffic for path, traffic in old_streams}
+    change = 0
+    for path, traffic in new_streams:
+        change += abs(traffic - old.pop(path, 0))
+    return change + sum(old.values())
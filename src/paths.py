@@ -0,0 +1,40 @@
+class PathTree:
+    # interned stream paths: a path is the id of its last hop and points to the path it extends,
+    # so extending a path and checking it for a node are O(1)
+    CORE = "core"
+
+    def __init__(self):
+        self.node = []  # last node of the path
+        self.parent = []  # path without its last node, -1 for the path of a single node
+        self.origin = []  # first node of the path
+        self.length = []  # number of nodes, "core" included
+        self.visited = []  # bitset of the node ids on the path
+        self.children = {}  # (parent, node) -> path
+
+    def clear(self):
+        self.__init__()
+
+    def root(self, node):
+        return self.extend(-1, node)
+
+    def extend(self, path, node):
+        node = node if isinstance(node, str) else int(node)
+        child = self.children.get((path, node))
+        if child is None:
+            child = len(self.node)
+            self.children[(path, node)] = child
+            self.node.append(node)
+            self.parent.append(path)
+            bit = 0 if isinstance(node, str) else 1 << node
+            if path < 0:
+                self.origin.append(node)
+                self.length.append(1)
+                self.visited.append(bit)
+            else:
+                self.origin.append(self.origin[path])
+                self.length.append(self.length[path] + 1)
+                self.visited.append(self.visited[path] | bit)
+        return child
+
+    def visits(self, path, node):
+        return (self.visited[path] >> int(node)) & 1 == 1
@@ -0,0 +1,89 @@
+import pickle
+import h5py
+import numpy as np
+
+
+class ResultsWriter:
+    # buffers one row per time step in preallocated columns and appends them to an hdf5 file in chunks
+
+    def __init__(self, file, chunk_size=1000):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.columns = None
+        self.rows = 0
+
+        # start a fresh file, rows are only ever appended by flush()
+        with h5py.File(self.file, 'w'):
+            pass
+
+    def append(self, row):
+        if self.columns is None:
+            self.columns = {name: np.empty(self.chunk_size, dtype=column_dtype(value)) for name, value in row.items()}
+
+        for name, value in row.items():
+            self.columns[name][self.rows] = value
+        self.rows += 1
+
+        if self.rows == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows == 0:
+            return
+
+        with h5py.File(self.file, 'a') as f:
+            for name, column in self.columns.items():
+                if name not in f:
+                    dtype = h5py.string_dtype() if column.dtype == object else column.dtype
+                    f.create_dataset(name, shape=(0,), maxshape=(None,), dtype=dtype, chunks=(self.chunk_size,))
+                dset = f[name]
+                start = dset.shape[0]
+                dset.resize((start + self.rows,))
+                dset[start:] = column[:self.rows]
+        self.rows = 0
+
+    def close(self):
+        self.flush()
+
+
+def column_dtype(value):
+    if isinstance(value, str):
+        return object
+    dtype = np.asarray(value).dtype
+    # numbers are stored as float64, the first row may hold an int for a column that is a float later on
+    if dtype.kind in 'iuf':
+        return np.float64
+    return dtype
+
+
+def read_results(file):
+    # all columns of a results file, legacy pickle streams are converted on the fly
+    if not h5py.is_hdf5(file):
+        return read_pickle_results(file)
+
+    with h5py.File(file, 'r') as f:
+        return {name: (dset.asstr()[:] if h5py.check_string_dtype(dset.dtype) else dset[:])
+                for name, dset in f.items()}
+
+
+def read_pickle_results(file):
+    records = []
+    with open(file, 'rb') as f:
+        while True:
+            try:
+                records.append(pickle.load(f))
+            except EOFError:
+                break
+
+    if len(records) == 0:
+        return {}
+    return {name: np.array([record[name] for record in records]) for name in records[0]}
+
+
+def convert_pickle_results(pickle_file, file):
+    with h5py.File(file, 'w') as f:
+        for name, column in read_pickle_results(pickle_file).items():
+            if column.dtype.kind == 'U':
+                f.create_dataset(name, data=column.astype(object), dtype=h5py.string_dtype(), maxshape=(None,))
+            else:
+                f.create_dataset(name, data=column, maxshape=(None,))
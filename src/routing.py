@@ -0,0 +1,70 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+
+class RoutingOracle:
+    # shortest ISL paths of one step from every satellite to its closest groundstation, computed on the first request
+    # and shared by all strategies. A virtual source reaches every satellite with a GSL over its shortest GSL, so a
+    # single Dijkstra from it gives the distance to the ground of every satellite and the tree of next hops
+
+    def __init__(self, links):
+        self.links = links
+        self.num_satellites = len(links.isl_indptr) - 1
+        self.distance = None
+        self.next_hop = None
+        self.nearest = {}  # K -> [N, K] distances and next hops of nearest_next_hops
+
+    def shortest_paths(self):
+        # distance to the ground (inf if unreachable) and next hop (-1 if none) of every satellite
+        if self.distance is None:
+            links = self.links
+            n = self.num_satellites
+            isl = slice(0, links.num_isls)
+
+            # shortest GSL of every satellite, the first one of its GSL_connections on ties
+            gsl = np.arange(links.num_isls, len(links.src))
+            gsl = gsl[np.lexsort((links.distance[gsl], links.src[gsl]))]
+            closest = gsl[np.concatenate(([True], links.src[gsl][1:] != links.src[gsl][:-1]))]
+            ground = np.full(n, -1)
+            ground[links.src[closest]] = links.dst[closest]
+
+            rows = np.concatenate((links.src[isl], np.full(len(closest), n)))
+            cols = np.concatenate((links.dst[isl], links.src[closest]))
+            weights = np.concatenate((links.distance[isl], links.distance[closest]))
+            graph = csr_matrix((weights, (rows, cols)), shape=(n + 1, n + 1))
+            distance, predecessor = dijkstra(graph, indices=n, return_predecessors=True)
+
+            self.distance = distance[:n]
+            self.next_hop = np.where(predecessor[:n] == n, ground, np.maximum(predecessor[:n], -1))
+        return self.distance, self.next_hop
+
+    def nearest_next_hops(self, K):
+        # the K neighbours of every satellite with the shortest distance to the ground through them, sorted by that
+        # distance: its groundstations directly and the satellites with an ISL to it over their shortest path.
+        # Rows are padded with inf distances and -1 next hops
+        if K not in self.nearest:
+            links = self.links
+            n = self.num_satellites
+            distance, _ = self.shortest_paths()
+            isl = slice(0, links.num_isls)
+            gsl = slice(links.num_isls, len(links.src))
+
+            owner = np.concatenate((links.src[gsl], links.dst[isl]))
+            hop = np.concatenate((links.dst[gsl], links.src[isl]))
+            via = np.concatenate((links.distance[gsl], distance[links.src[isl]] + links.distance[isl]))
+            reachable = via < np.inf
+            owner, hop, via = owner[reachable], hop[reachable], via[reachable]
+
+            order = np.lexsort((via, owner))
+            owner, hop, via = owner[order], hop[order], via[order]
+            starts = np.searchsorted(owner, np.arange(n))
+            rank = np.arange(len(owner)) - starts[owner]
+            kept = rank < K
+
+            distances = np.full((n, K), np.inf)
+            next_hops = np.full((n, K), -1)
+            distances[owner[kept], rank[kept]] = via[kept]
+            next_hops[owner[kept], rank[kept]] = hop[kept]
+            self.nearest[K] = distances, next_hops
+        return self.nearest[K]
@@ -2,15 +2,74 @@ import math
 import numpy as np
 
 
+class NetworkState:
+    # per-node quantities of all satellites (ids 0..N-1) and groundstations (ids N..N+G-1) as arrays indexed by node id
+
+    def __init__(self, num_satellites, num_groundstations):
+        self.num_satellites = num_satellites
+        self.num_groundstations = num_groundstations
+        num_nodes = num_satellites + num_groundstations
+
+        self.position = np.zeros((num_nodes, 3))
+        self.long = np.zeros(num_nodes)
+        self.lat = np.zeros(num_nodes)
+
+        self.generation_rate = np.zeros(num_nodes)
+        self.buffer_level = np.zeros(num_nodes)
+        self.drop_rate = np.zeros(num_nodes)
+        self.delay = np.zeros(num_nodes)
+        self.cost = np.zeros(num_nodes)
+
+        # LinkTable of the current step, rebuilt once the targets can be set, and the RoutingOracle over its geometry
+        self.links = None
+        self.routing = None
+
+    def update_positions(self, positions, first_id=0):
+        ids = slice(first_id, first_id + len(positions))
+        x, y, z = positions[:, 0], positions[:, 1], positions[:, 2]
+
+        self.position[ids] = positions
+        self.long[ids] = np.degrees(np.arctan2(y, x))
+        self.lat[ids] = np.degrees(np.arctan2(z, np.sqrt(x ** 2 + y ** 2)))
+
+    def update_generation_rates(self, data_generation, growth_factor=1):
+        self.generation_rate[:self.num_satellites] = growth_factor * data_generation
+
+    def share_positions(self, other):
+        # positions and generation rates of the same trace are shared instead of copied each step
+        self.position = other.position
+        self.long = other.long
+        self.lat = other.lat
+        self.generation_rate = other.generation_rate
+
+
+class NodeField:
+    # attribute of a node that is stored in the NetworkState column of the same name
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, node, owner=None):
+        if node is None:
+            return self
+        return getattr(node.network, self.name)[node.id]
+
+    def __set__(self, node, value):
+        getattr(node.network, self.name)[node.id] = value
+
+
 class State:
+    # position of one node, read from its NetworkState
+    x = property(lambda self: self.network.position[self.id, 0])
+    y = property(lambda self: self.network.position[self.id, 1])
+    z = property(lambda self: self.network.position[self.id, 2])
+    long = property(lambda self: self.network.long[self.id])
+    lat = property(lambda self: self.network.lat[self.id])
 
-    def __init__(self, long, lat, x, y, z):
+    def __init__(self, network, node_id):
 
-        self.long = long
-        self.lat = lat
-        self.x = x
-        self.y = y
-        self.z = z
+        self.network = network
+        self.id = node_id
 
     def as_vector(self):
         return np.array([self.long, self.lat])
@@ -125,28 +125,18 @@ class QLearning(Strategy):
         return int(hour // 4)  # {0..5}
 
     def _bin_min_gsl_distance(self, sat, groundstations, n_sats):
-        if not sat.GSL_connections:
+        if len(sat.GSL_connections) == 0:
             return 9
-        dists = []
-        for gs_id in sat.GSL_connections:
-            gs = groundstations[int(gs_id) - n_sats]
-            dists.append(sat.state.distance_to(gs.state))
-        d_km = min(dists) / 1000.0
+        links = sat.network.links
+        d_km = links.distance[links.gsls(sat.id)].min() / 1000.0
         return int(min(8, d_km // 1000))
 
     def _bin_best_isl_capacity(self, sat, satellites):
         if len(sat.ISL_connections) == 0:
             return 0
-        caps = []
-        for nb_id in sat.ISL_connections:
-            nb = satellites[int(nb_id)]
-            dist = sat.state.distance_to(nb.state)
-            try:
-                cap = sat.isl_capacity(dist)
-            except Exception:
-                cap = 0.0
-            caps.append(max(0.0, float(cap)))
-        cap_gbps = max(caps) / 1e9
+        links = sat.network.links
+        caps = np.maximum(0.0, links.capacity[links.isls(sat.id)])
+        cap_gbps = caps.max() / 1e9
         if cap_gbps <= 0: return 0
         if cap_gbps <= 0.5: return 1
         if cap_gbps <= 1.0: return 2
@@ -8,3 +8,7 @@ class Strategy:
 
     def reset(self, satellites):
         pass
+
+    def stats(self):
+        # extra columns of the results rows, e.g. the hash table use of TileCodedUCB
+        return {}
@@ -1,14 +1,12 @@
-import heapq
 import math
-from datetime import timedelta
-
 import numpy as np
 from src.strategies.strategy import Strategy
+from src.strategies.ucb.ucb import log_totals
 
 
 class TileCodedUCB(Strategy):
 
-    def __init__(self, contexts, distance_precision, no_of_grids):
+    def __init__(self, contexts, distance_precision, no_of_grids, memory_budget=None):
         self.strategy_name = "tile_coded_ucb" + f"_{int(distance_precision):07}_" + str(no_of_grids)
 
         # UCB variables
@@ -28,135 +26,56 @@ class TileCodedUCB(Strategy):
 
         self.counter_cap = 1e10
 
-    def set_targets(self, satellites, groundstations, current_time):
-
-        dijkstra_targets = None
-        distances = None
-        if "dijkstra" in self.contexts or "total_distance" in self.contexts or "order" in self.contexts:
-            distances = {node.id: float('inf') for node in satellites}
-            dijkstra_targets = {node.id: None for node in satellites}
-
-            priority_queue = []
-
-            for satellite in satellites:
+        # context features of the links of the last step, see step_features
+        self.features_links = None
+        self.features = None
+        self.contexts_per_grid = None
+
+        # memory_budget (in bytes) replaces the tile dicts by hashed tiles: per grid, the integer tile coordinates of
+        # a (satellite, target) context are hashed into a fixed table of cost estimates, selection counts and the
+        # key of the context that claimed the entry. Contexts sharing an entry are counted as collisions
+        self.memory_budget = memory_budget
+        if memory_budget is not None:
+            self.strategy_name += "_hashed"
+            self.table_size = int(memory_budget // (24 * no_of_grids))
+            if self.table_size < 1:
+                raise ValueError(f"a memory budget of {memory_budget} bytes holds no hashed tile, {no_of_grids} grids "
+                                 f"need at least {24 * no_of_grids} bytes")
+            self.hashed_tiles = np.zeros((no_of_grids, self.table_size, 2))  # cost estimate, number of usages
+            self.hashed_keys = np.zeros((no_of_grids, self.table_size), dtype=np.uint64)
+            self.lookups = 0
+            self.lookup_collisions = 0  # lookups of an entry claimed by another context
+            self.updates = 0
+            self.collisions = 0  # updates of an entry claimed by another context
 
-                for gs_id in satellite.GSL_connections:
-                    gs = groundstations[gs_id - len(satellites)]
-                    initial_distance = satellite.state.distance_to(gs.state)
-                    if initial_distance < distances[satellite.id]:
-                        distances[satellite.id] = initial_distance
-                        dijkstra_targets[satellite.id] = gs.id
-                if distances[satellite.id] < math.inf:
-                    priority_queue += [(distances[satellite.id], satellite)]
-
-            while priority_queue:
-                current_distance, current_node = heapq.heappop(priority_queue)
-
-                if current_distance > distances[current_node.id]:
-                    continue
-
-                for sat_id in current_node.ISL_connections:
-                    sat = satellites[sat_id]
-                    distance = current_distance + current_node.state.distance_to(sat.state)
+    def set_targets(self, satellites, groundstations, current_time):
 
-                    if distance < distances[sat.id]:
-                        distances[sat.id] = distance
-                        dijkstra_targets[sat.id] = current_node.id
-                        heapq.heappush(priority_queue, (distance, sat))
-
-            for gs in groundstations:
-                distances[gs.id] = 0
-            for sat in satellites:
-                if math.isinf(distances[sat.id]):
-                    distances[sat.id] = 1e8
+        if self.memory_budget is not None:
+            self.set_targets_hashed(satellites, groundstations, current_time)
+            return
 
         if len(self.tiles) == 0:
             for sat in satellites:
                 self.tiles[sat] = {}
 
-        for sat in satellites:
+        contexts = self.grid_contexts(satellites, current_time)
+        links = satellites[0].network.links
+        candidates = np.argsort(links.src, kind="stable")  # targets of every satellite in connection order
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(links.src, minlength=len(satellites))))).tolist()
 
-            targets_sorted_by_distance = None
-            if "order" in self.contexts:
-                target_ids = [int(i) for i in np.concatenate((sat.ISL_connections, sat.GSL_connections))]
-                targets_sorted_by_distance = (
-                    sorted(target_ids,
-                           key=lambda t_id:
-                           distances[int(t_id)] + sat.state.distance_to(satellites[t_id].state)
-                           if int(t_id) in sat.ISL_connections else
-                           distances[int(t_id)] + sat.state.distance_to(groundstations[t_id - len(satellites)].state)))
+        for sat in satellites:
 
             total_selections = [0 for _ in range(self.no_of_grids)]
             cost_count_per_target = [{} for _ in range(self.no_of_grids)]
-            for target_id in np.concatenate((sat.ISL_connections, sat.GSL_connections)):
-                target_id = int(target_id)
+            sat_links = candidates[indptr[sat.id]:indptr[sat.id + 1]].tolist()
+            for link in sat_links:
+                target_id = int(links.dst[link])
 
                 if target_id not in self.tiles[sat]:
                     self.tiles[sat][target_id] = {}
 
-                if target_id in sat.ISL_connections:
-                    target = satellites[target_id]
-                else:
-                    target = groundstations[target_id - len(satellites)]
-
-                if "elevation" in self.contexts:
-                    elev = (sat.state.x^2 + sat.state.y^2 + sat.state.z^2) - 6371000
-                else:
-                    elev = 0
-
-                if "distance" in self.contexts:
-                    distance = sat.state.distance_to(target.state)
-                else:
-                    distance = 0
-
-                if "data" in self.contexts:
-                    data = sat.generation_rate
-                else:
-                    data = 0
-
-                if "local_time" in self.contexts:
-                    offset = int((sat.state.long + 180) / 15) - 12
-                    local_time = current_time.to_datetime() + timedelta(hours=offset)
-                    t = int(local_time.hour) * 3600 + int(local_time.minute) * 60 + int(local_time.second)
-                else:
-                    t = 0
-
-                if "utc_time" in self.contexts:
-                    utc_time = current_time.to_datetime()
-                    u = int(utc_time.hour) * 3600 + int(utc_time.minute) * 60 + int(utc_time.second)
-                else:
-                    u = 0
-
-                if "dijkstra" in self.contexts:
-                    dijkstra = target_id == dijkstra_targets[sat.id]
-                else:
-                    dijkstra = 0
-
-                if "total_distance" in self.contexts:
-                    total_distance = distances[target.id] + sat.state.distance_to(target.state)
-                else:
-                    total_distance = 0
-
-                if "order" in self.contexts:
-                    order = int(targets_sorted_by_distance.index(target_id) == 0)
-                else:
-                    order = 0
-
                 for grid_no in range(self.no_of_grids):
-                    context = (int(distance / self.distance_precision + grid_no / self.no_of_grids)
-                               - grid_no / self.no_of_grids,
-                               int(math.log(data + 1, self.data_precision_base) + grid_no / self.no_of_grids)
-                               - grid_no / self.no_of_grids,
-                               int(t / self.time_precision + grid_no / self.no_of_grids)
-                               - grid_no / self.no_of_grids,
-                               int(u / self.time_precision + grid_no / self.no_of_grids)
-                               - grid_no / self.no_of_grids,
-                               dijkstra,
-                               order,
-                               int(total_distance / self.total_distance_precision + grid_no / self.no_of_grids)
-                               - grid_no / self.no_of_grids,
-                               int(elev / self.elev_precision + grid_no / self.no_of_grids)
-                               - grid_no / self.no_of_grids)
+                    context = contexts[grid_no][link]
 
                     if context not in self.tiles[sat][target_id]:
                         self.tiles[sat][target_id][context] = [0, 0]
@@ -165,8 +84,8 @@ class TileCodedUCB(Strategy):
                     total_selections[grid_no] += cost_count_per_target[grid_no][target_id][1]
 
             targets = []
-            for target_id in np.concatenate((sat.ISL_connections, sat.GSL_connections)):
-                target_id = int(target_id)
+            for link in sat_links:
+                target_id = int(links.dst[link])
 
                 ucb_value = 0
                 for grid_no in range(self.no_of_grids):
@@ -189,130 +108,188 @@ class TileCodedUCB(Strategy):
 
     def learn(self, satellites, groundstations, current_time):
 
-        dijkstra_targets = None
-        distances = None
-        if "dijkstra" in self.contexts or "total_distance" in self.contexts or "order" in self.contexts:
-            distances = {node.id: float('inf') for node in satellites}
-            dijkstra_targets = {node.id: None for node in satellites}
-
-            priority_queue = []
-
-            for satellite in satellites:
-
-                for gs_id in satellite.GSL_connections:
-                    gs = groundstations[gs_id - len(satellites)]
-                    initial_distance = satellite.state.distance_to(gs.state)
-                    if initial_distance < distances[satellite.id]:
-                        distances[satellite.id] = initial_distance
-                        dijkstra_targets[satellite.id] = gs.id
-                if distances[satellite.id] < math.inf:
-                    priority_queue += [(distances[satellite.id], satellite)]
-
-            while priority_queue:
-                current_distance, current_node = heapq.heappop(priority_queue)
+        if self.memory_budget is not None:
+            self.learn_hashed(satellites, groundstations, current_time)
+            return
 
-                if current_distance > distances[current_node.id]:
-                    continue
-
-                for sat_id in current_node.ISL_connections:
-                    sat = satellites[sat_id]
-                    distance = current_distance + current_node.state.distance_to(sat.state)
-
-                    if distance < distances[sat.id]:
-                        distances[sat.id] = distance
-                        dijkstra_targets[sat.id] = current_node.id
-                        heapq.heappush(priority_queue, (distance, sat))
-
-            for gs in groundstations:
-                distances[gs.id] = 0
-            for sat in satellites:
-                if math.isinf(distances[sat.id]):
-                    distances[sat.id] = 1e8
+        contexts = self.grid_contexts(satellites, current_time)
+        links = satellites[0].network.links
 
         for sat in satellites:
-
-            targets_sorted_by_distance = None
-            if "order" in self.contexts:
-                target_ids = [int(i) for i in np.concatenate((sat.ISL_connections, sat.GSL_connections))]
-                targets_sorted_by_distance = (
-                    sorted(target_ids,
-                           key=lambda t_id:
-                           distances[int(t_id)] + sat.state.distance_to(satellites[t_id].state)
-                           if int(t_id) in sat.ISL_connections else
-                           distances[int(t_id)] + sat.state.distance_to(groundstations[t_id - len(satellites)].state)))
-
             if sat.cost > 0:
                 if len(sat.target_ids) > 0:
                     target_id = sat.target_ids[0]
                     if target_id is not None:
-
-                        if target_id in sat.ISL_connections:
-                            target = satellites[target_id]
-                        else:
-                            target = groundstations[target_id - len(satellites)]
-
-                        if "elevation" in self.contexts:
-                            elev = (sat.state.x^2 + sat.state.y^2 + sat.state.z^2) - 6371000
-                        else:
-                            elev = 0
-
-                        if "distance" in self.contexts:
-                            distance = sat.state.distance_to(target.state)
-                        else:
-                            distance = 0
-
-                        if "data" in self.contexts:
-                            data = sat.generation_rate
-                        else:
-                            data = 0
-
-                        if "local_time" in self.contexts:
-                            offset = int((sat.state.long + 180) / 15) - 12
-                            local_time = current_time.to_datetime() + timedelta(hours=offset)
-                            t = int(local_time.hour) * 3600 + int(local_time.minute) * 60 + int(local_time.second)
-                        else:
-                            t = 0
-
-                        if "utc_time" in self.contexts:
-                            utc_time = current_time.to_datetime()
-                            u = int(utc_time.hour) * 3600 + int(utc_time.minute) * 60 + int(utc_time.second)
-                        else:
-                            u = 0
-
-                        if "dijkstra" in self.contexts:
-                            dijkstra = target_id == dijkstra_targets[sat.id]
-                        else:
-                            dijkstra = 0
-
-                        if "total_distance" in self.contexts:
-                            total_distance = distances[target.id] + sat.state.distance_to(target.state)
-                        else:
-                            total_distance = 0
-
-                        if "order" in self.contexts:
-                            order = int(targets_sorted_by_distance.index(target_id) == 0)
-                        else:
-                            order = 0
+                        link = links.find(sat.id, target_id)
 
                         for grid_no in range(self.no_of_grids):
-                            context = (int(distance / self.distance_precision + grid_no / self.no_of_grids)
-                                       - grid_no / self.no_of_grids,
-                                       int(math.log(data + 1, self.data_precision_base) + grid_no / self.no_of_grids)
-                                       - grid_no / self.no_of_grids,
-                                       int(t / self.time_precision + grid_no / self.no_of_grids)
-                                       - grid_no / self.no_of_grids,
-                                       int(u / self.time_precision + grid_no / self.no_of_grids)
-                                       - grid_no / self.no_of_grids,
-                                       dijkstra,
-                                       order,
-                                       int(total_distance / self.total_distance_precision + grid_no / self.no_of_grids)
-                                       - grid_no / self.no_of_grids,
-                                       int(elev / self.elev_precision + grid_no / self.no_of_grids)
-                                      - grid_no / self.no_of_grids
-                            )
+                            context = contexts[grid_no][link]
 
                             old_estimate, n = self.tiles[sat][target_id][context]
                             self.tiles[sat][target_id][context][0] = (
                                     (n * old_estimate + sat.cost) / (n + 1))
                             if n <= self.counter_cap:
                                 self.tiles[sat][target_id][context][1] = n + 1
+
+    def step_features(self, satellites, current_time):
+        # contexts of all links (satellite -> target) of the step in tile units, computed once for set_targets and
+        # learn. Columns as in the context tuple: distance, data, local time, utc time, dijkstra, order, total
+        # distance and elevation, 0 if the context is not used
+        network = satellites[0].network
+        links = network.links
+        if self.features_links is links:
+            return self.features
+
+        src, dst = links.src, links.dst
+        features = np.zeros((len(src), 8))
+
+        if "distance" in self.contexts:
+            features[:, 0] = links.distance / self.distance_precision
+
+        if "data" in self.contexts:
+            data = [math.log(sat.generation_rate + 1, self.data_precision_base) for sat in satellites]
+            features[:, 1] = np.array(data)[src]
+
+        utc_time = current_time.to_datetime()
+        u = int(utc_time.hour) * 3600 + int(utc_time.minute) * 60 + int(utc_time.second)
+        if "local_time" in self.contexts:
+            offset = ((network.long[src] + 180) / 15).astype(int) - 12
+            features[:, 2] = ((u + offset * 3600) % 86400) / self.time_precision
+
+        if "utc_time" in self.contexts:
+            features[:, 3] = u / self.time_precision
+
+        if "dijkstra" in self.contexts or "total_distance" in self.contexts or "order" in self.contexts:
+            shortest_distances, next_hops = network.routing.shortest_paths()
+            distances = np.zeros(len(network.position))
+            distances[:len(satellites)] = np.where(np.isinf(shortest_distances), 1e8, shortest_distances)
+            total_distance = distances[dst] + links.distance
+
+            if "dijkstra" in self.contexts:
+                features[:, 4] = dst == next_hops[src]
+
+            if "order" in self.contexts:
+                # the first target of the satellite with the shortest total distance, targets in connection order
+                candidates = np.argsort(src, kind="stable")
+                candidates = candidates[np.lexsort((total_distance[candidates], src[candidates]))]
+                first = np.concatenate(([True], src[candidates][1:] != src[candidates][:-1]))
+                features[candidates[first], 5] = 1
+
+            if "total_distance" in self.contexts:
+                features[:, 6] = total_distance / self.total_distance_precision
+
+        if "elevation" in self.contexts:
+            features[:, 7] = (np.linalg.norm(network.position[src], axis=1) - 6371000) / self.elev_precision
+
+        self.features_links = links
+        self.features = features
+        self.contexts_per_grid = None
+        return features
+
+    def grid_contexts(self, satellites, current_time):
+        # context tuple of every link per grid, the dijkstra and order flags are not tiled
+        features = self.step_features(satellites, current_time)
+        if self.contexts_per_grid is None:
+            self.contexts_per_grid = []
+            for grid_no in range(self.no_of_grids):
+                offset = grid_no / self.no_of_grids
+                tiles = np.trunc(features + offset) - offset
+                tiles[:, 4:6] = features[:, 4:6]
+                self.contexts_per_grid.append([tuple(context) for context in tiles.tolist()])
+        return self.contexts_per_grid
+
+    def hashed_entries(self, satellites, current_time, link_ids):
+        # entry and key of the tile of every link per grid, [grid, link]
+        links = satellites[0].network.links
+        features = self.step_features(satellites, current_time)[link_ids]
+        entries = np.empty((self.no_of_grids, len(link_ids)), dtype=np.int64)
+        keys = np.empty((self.no_of_grids, len(link_ids)), dtype=np.uint64)
+        for grid_no in range(self.no_of_grids):
+            tiles = (features + grid_no / self.no_of_grids).astype(np.int64)
+            columns = [links.src[link_ids], links.dst[link_ids], np.full(len(link_ids), grid_no)] + list(tiles.T)
+            key = hash_columns(columns)
+            entries[grid_no] = (key % np.uint64(self.table_size)).astype(np.int64)
+            keys[grid_no] = key | np.uint64(1)
+        return entries, keys
+
+    def set_targets_hashed(self, satellites, groundstations, current_time):
+
+        links = satellites[0].network.links
+        candidates = np.argsort(links.src, kind="stable")  # targets of every satellite in connection order
+        src = links.src[candidates]
+        entries, keys = self.hashed_entries(satellites, current_time, candidates)
+        owners = self.hashed_keys[np.arange(self.no_of_grids)[:, None], entries]
+        self.lookups += entries.size
+        self.lookup_collisions += int(((owners != 0) & (owners != keys)).sum())
+
+        ucb_values = np.zeros(len(candidates))
+        explored = np.ones(len(candidates), dtype=bool)
+        for grid_no in range(self.no_of_grids):
+            avg_cost, selection_count = self.hashed_tiles[grid_no, entries[grid_no]].T
+            total_selections = np.bincount(src, weights=selection_count, minlength=len(satellites))
+            log_selections = log_totals(total_selections)[src]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ucb_values += avg_cost - self.uncertainty_factor * np.sqrt(2 * log_selections / selection_count)
+            explored &= selection_count > 0
+        ucb_values = np.where(explored, ucb_values / self.no_of_grids, -np.inf)
+
+        order = np.lexsort((ucb_values, src))
+        sorted_targets = np.split(links.dst[candidates][order], np.cumsum(np.bincount(src, minlength=len(satellites))))
+        for sat in satellites:
+            sat.target_ids = sorted_targets[sat.id].tolist()
+
+    def learn_hashed(self, satellites, groundstations, current_time):
+
+        network = satellites[0].network
+        cost = network.cost[:len(satellites)]
+        learning = [sat for sat in satellites if cost[sat.id] > 0 and len(sat.target_ids) > 0
+                    and sat.target_ids[0] is not None]
+        if len(learning) == 0:
+            return
+        link_ids = np.array([network.links.find(sat.id, sat.target_ids[0]) for sat in learning])
+        cost = cost[network.links.src[link_ids]]
+        entries, keys = self.hashed_entries(satellites, current_time, link_ids)
+
+        for grid_no in range(self.no_of_grids):
+            tiles = self.hashed_tiles[grid_no]
+            owners = self.hashed_keys[grid_no, entries[grid_no]]
+            self.hashed_keys[grid_no, entries[grid_no][owners == 0]] = keys[grid_no][owners == 0]
+            self.updates += len(link_ids)
+            self.collisions += int((self.hashed_keys[grid_no, entries[grid_no]] != keys[grid_no]).sum())
+
+            if len(np.unique(entries[grid_no])) == len(link_ids):
+                old_estimate, n = tiles[entries[grid_no]].T
+                tiles[entries[grid_no], 0] = (n * old_estimate + cost) / (n + 1)
+                tiles[entries[grid_no], 1] = np.where(n <= self.counter_cap, n + 1, n)
+            else:
+                # links sharing an entry in this grid are applied one after another
+                for entry, link_cost in zip(entries[grid_no], cost):
+                    old_estimate, n = tiles[entry]
+                    tiles[entry, 0] = (n * old_estimate + link_cost) / (n + 1)
+                    if n <= self.counter_cap:
+                        tiles[entry, 1] = n + 1
+
+    def stats(self):
+        if self.memory_budget is None:
+            return {}
+        return {"tile_" + name: value for name, value in self.collision_stats().items()}
+
+    def collision_stats(self):
+        # share of the hashed entries in use and of the lookups and updates that hit an entry of another context
+        return {"entries": self.hashed_keys.size,
+                "occupancy": float((self.hashed_keys != 0).mean()),
+                "lookups": self.lookups,
+                "lookup_collision_rate": self.lookup_collisions / self.lookups if self.lookups > 0 else 0,
+                "updates": self.updates,
+                "update_collision_rate": self.collisions / self.updates if self.updates > 0 else 0}
+
+
+def hash_columns(columns):
+    # 64 bit hash of the rows of integer columns (FNV-1a over the values with a final avalanche)
+    key = np.full(len(columns[0]), 0xcbf29ce484222325, dtype=np.uint64)
+    for column in columns:
+        key = (key ^ np.asarray(column).astype(np.uint64)) * np.uint64(0x100000001b3)
+    key ^= key >> np.uint64(33)
+    key *= np.uint64(0xff51afd7ed558ccd)
+    key ^= key >> np.uint64(33)
+    return key
@@ -10,53 +10,50 @@ class UCB(Strategy):
 
         # UCB variables
         self.uncertainty_factor = 1
-        self.cost_estimates = {}  # format: {satellite: {nodeID: [cost estimate, number of usages]}}
+        # format: [satellite, target node id, (cost estimate, number of usages)], indexed by node id as the neighbours
+        # change over the orbit and the selections of all targets ever used count. One array, saved with np.save
+        self.cost_estimates = None
 
         self.counter_cap = 1e10
 
     def set_targets(self, satellites, groundstations, current_time):
 
-        if len(self.cost_estimates) == 0:
-            for sat in satellites:
-                self.cost_estimates[sat] = {}
+        network = satellites[0].network
+        if self.cost_estimates is None:
+            self.cost_estimates = np.zeros((len(satellites), len(satellites) + len(groundstations), 2))
 
-        for sat in satellites:
-
-            total_selections = sum([value[1] for value in self.cost_estimates[sat].values()])
+        neighbours, num_neighbours = network.links.neighbour_table()
+        rows = np.arange(len(satellites))[:, None]
+        avg_cost = self.cost_estimates[rows, neighbours, 0]
+        selection_count = self.cost_estimates[rows, neighbours, 1]
+        log_selections = log_totals(self.cost_estimates[:, :, 1].sum(axis=1))[:, None]
 
-            targets = []
-            for target_id in np.concatenate((sat.ISL_connections, sat.GSL_connections)):
-                target_id = int(target_id)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ucb_values = np.where(selection_count > 0, avg_cost - self.uncertainty_factor *
+                                  np.sqrt(2 * log_selections / selection_count), -np.inf)
+        ucb_values[neighbours < 0] = np.inf
 
-                if target_id not in self.cost_estimates[sat]:
-                    self.cost_estimates[sat][target_id] = [0, 0]
+        sorted_targets = np.take_along_axis(neighbours, np.argsort(ucb_values, axis=1, kind="stable"), axis=1)
+        for sat in satellites:
+            sat.target_ids = sorted_targets[sat.id, :num_neighbours[sat.id]].tolist()
 
-                avg_cost, selection_count = self.cost_estimates[sat][target_id]
-                if selection_count > 0:
-                    ucb_value = (avg_cost - self.uncertainty_factor *
-                                 math.sqrt(2 * math.log(total_selections) / selection_count))
-                else:
-                    ucb_value = -math.inf
-                targets += [[target_id, ucb_value]]
+    def learn(self, satellites, groundstations, current_time):
 
-            sorted_targets = sorted(targets, key=lambda x: x[1])
+        cost = satellites[0].network.cost[:len(satellites)]
+        target_ids = np.array([sat.target_ids[0] if len(sat.target_ids) > 0 and sat.target_ids[0] is not None
+                               else -1 for sat in satellites])
+        sat_ids = np.flatnonzero((cost > 0) & (target_ids >= 0))
+        target_ids = target_ids[sat_ids]
 
-            if len(sorted_targets) > 0:
-                sat.target_ids = list(map(lambda x: x[0], sorted_targets))
-            else:
-                sat.target_ids = []
+        old_estimate = self.cost_estimates[sat_ids, target_ids, 0]
+        n = self.cost_estimates[sat_ids, target_ids, 1]
+        self.cost_estimates[sat_ids, target_ids, 0] = (n * old_estimate + cost[sat_ids]) / (n + 1)
+        self.cost_estimates[sat_ids, target_ids, 1] = np.where(n <= self.counter_cap, n + 1, n)
 
-    def learn(self, satellites, groundstations, current_time):
+    def reset(self, satellites):
+        self.cost_estimates = None
 
-        for sat in satellites:
-            if sat.cost > 0:
-                if len(sat.target_ids) > 0:
-                    target_id = sat.target_ids[0]
-                    if target_id is not None:
-                        old_estimate, n = self.cost_estimates[sat][target_id]
-                        self.cost_estimates[sat][target_id][0] = (n * old_estimate + sat.cost) / (n + 1)
-                        if self.cost_estimates[sat][target_id][1] <= self.counter_cap:
-                            self.cost_estimates[sat][target_id][1] += 1
 
-    def reset(self, satellites):
-        self.cost_estimates = {}
+def log_totals(totals):
+    # math.log per entry, np.log may differ in the last bit and reorder targets of equal estimates
+    return np.array([math.log(total) if total > 0 else -math.inf for total in totals.tolist()])
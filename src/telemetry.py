@@ -0,0 +1,127 @@
+import queue
+import threading
+import h5py
+import numpy as np
+
+
+def stream_traffic(streams):
+    return sum(stream[1] for all_streams in streams.values() for stream in all_streams)
+
+
+satellite_fields = {
+    "position": lambda n: (n.state.x, n.state.y, n.state.z),
+    "generation_rate": lambda n: n.generation_rate,
+    "buffer_level": lambda n: n.buffer_level,
+    "incoming_traffic": lambda n: stream_traffic(n.incoming_streams),
+    "outgoing_traffic": lambda n: stream_traffic(n.outgoing_streams),
+    "delay": lambda n: n.delay,
+    "drop_rate": lambda n: n.drop_rate,
+    "local_drop_rate": lambda n: n.local_drop_rate,
+    "cost": lambda n: n.cost,
+    "neighbours": lambda n: len(n.ISL_connections),
+    "main_target": lambda n: int(n.target_ids[0]) if len(n.target_ids) > 0 else -1
+}
+
+groundstation_fields = {
+    "position": lambda n: (n.state.x, n.state.y, n.state.z),
+    "buffer_level": lambda n: n.buffer_level,
+    "incoming_traffic": lambda n: stream_traffic(n.incoming_streams),
+    "outgoing_traffic": lambda n: stream_traffic(n.outgoing_streams),
+    "delay": lambda n: n.delay,
+    "drop_rate": lambda n: n.drop_rate
+}
+
+
+class TelemetryWriter:
+    # per-node state of every `every`-th step as [steps, nodes] tables in an hdf5 file,
+    # written in batches by a background thread
+
+    def __init__(self, file, fields=None, every=1, batch_size=100):
+        self.file = file
+        self.every = every
+        self.batch_size = batch_size
+
+        # fields=None logs everything, "links" selects the per-link table
+        self.satellite_fields = {name: get for name, get in satellite_fields.items()
+                                 if fields is None or name in fields}
+        self.groundstation_fields = {name: get for name, get in groundstation_fields.items()
+                                     if fields is None or name in fields}
+        self.log_links = fields is None or "links" in fields
+
+        self.batch = []
+        self.queue = queue.Queue(maxsize=4)
+        self.error = None
+        with h5py.File(self.file, 'w'):
+            pass
+        self.thread = threading.Thread(target=self._write_batches, daemon=True)
+        self.thread.start()
+
+    def log(self, step, time, satellites, groundstations):
+        if step % self.every != 0:
+            return
+
+        record = {"time": time}
+        for name, get in self.satellite_fields.items():
+            record["satellites/" + name] = np.array([get(sat) for sat in satellites])
+        for name, get in self.groundstation_fields.items():
+            record["groundstations/" + name] = np.array([get(gs) for gs in groundstations])
+
+        if self.log_links:
+            links = [(sat.id, target, sat.outgoing_throughputs.get(target, 0),
+                      sum(stream[1] for stream in sat.outgoing_streams.get(target, [])))
+                     for sat in satellites for target in sat.target_ids]
+            links = np.array(links, dtype=float).reshape(-1, 4)
+            record["links/step"] = np.full(len(links), step)
+            record["links/src"] = links[:, 0].astype(np.int32)
+            record["links/dst"] = links[:, 1].astype(np.int32)
+            record["links/throughput"] = links[:, 2]
+            record["links/traffic"] = links[:, 3]
+
+        self.batch.append(record)
+        if len(self.batch) == self.batch_size:
+            self._submit()
+
+    def close(self):
+        self._submit()
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _submit(self):
+        if self.error is not None:
+            raise self.error
+        if len(self.batch) > 0:
+            self.queue.put(self.batch)
+            self.batch = []
+
+    def _write_batches(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                return
+            if self.error is not None:
+                continue
+            try:
+                self._write(batch)
+            except Exception as e:
+                self.error = e
+
+    def _write(self, batch):
+        with h5py.File(self.file, 'a') as f:
+            for name in batch[0]:
+                if name == "time":
+                    values = np.array([record["time"] for record in batch], dtype=object)
+                elif name.startswith("links/"):
+                    values = np.concatenate([record[name] for record in batch])
+                else:
+                    values = np.stack([record[name] for record in batch])
+
+                if name not in f:
+                    dtype = h5py.string_dtype() if values.dtype == object else values.dtype
+                    f.create_dataset(name, shape=(0,) + values.shape[1:], maxshape=(None,) + values.shape[1:],
+                                     dtype=dtype, chunks=True, compression="gzip")
+                dset = f[name]
+                start = dset.shape[0]
+                dset.resize(start + len(values), axis=0)
+                dset[start:] = values
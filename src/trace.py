@@ -0,0 +1,258 @@
+import concurrent.futures
+import os
+from multiprocessing import shared_memory
+import h5py
+import numpy as np
+
+
+class TraceStep:
+
+    def __init__(self, positions, data_generation, isl_indptr, isl_indices, gsl_indptr, gsl_indices):
+        self.positions = positions  # [N, 3]
+        self.data_generation = data_generation  # [N]
+
+        # CSR adjacency: the row of satellite i is indices[indptr[i]:indptr[i + 1]]
+        self.isl_indptr = isl_indptr  # [N + 1]
+        self.isl_indices = isl_indices
+        self.gsl_indptr = gsl_indptr  # [N + 1], visible groundstations
+        self.gsl_indices = gsl_indices
+
+    def isl_connections(self, sat_id):
+        return self.isl_indices[self.isl_indptr[sat_id]:self.isl_indptr[sat_id + 1]]
+
+    def visible_groundstations(self, sat_id):
+        return self.gsl_indices[self.gsl_indptr[sat_id]:self.gsl_indptr[sat_id + 1]]
+
+
+def rows_to_csr(rows):
+    # rows: [T, N] object array of int32 rows -> indptr [T, N + 1] with offsets into one flat indices array
+    steps, num_satellites = rows.shape
+    lengths = np.fromiter(map(len, rows.ravel()), dtype=np.int64, count=rows.size)
+    offsets = np.zeros(rows.size + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    indptr = offsets[np.arange(steps)[:, np.newaxis] * num_satellites + np.arange(num_satellites + 1)]
+    indices = np.concatenate(rows.ravel()).astype(np.int32) if rows.size > 0 else np.zeros(0, dtype=np.int32)
+    return indptr, indices
+
+
+class TraceReader:
+    # dataset name and file pattern of every precomputed trace family
+    files = {
+        "isl_connections": ("grid/grid_{}.h5", "visibility"),
+        "visible_groundstations": ("visibility/groundstation_visibility/satellite_visibility_groundstations_{}.h5",
+                                   "visibility"),
+        "positions": ("positions/satellite_positions/satellite_positions_{}.h5", "positions"),
+        "data_generation": ("data_generation/satellite_data_generation_{}.h5", "data_generation")
+    }
+
+    def __init__(self, data_dir="data", steps_per_file=1000, block_size=100, prefetch=True):
+        self.data_dir = data_dir
+        self.steps_per_file = steps_per_file
+        self.block_size = min(block_size, steps_per_file)
+        self.prefetch = prefetch
+
+        # all hdf5 access happens on this single thread, so the handles are never shared
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.file_index = None
+        self.handles = {}
+
+        self.block_key = None
+        self.block = None
+        self.next_block_key = None
+        self.next_block = None
+
+    def read(self, step):
+        file_index = step // self.steps_per_file
+        row = step % self.steps_per_file
+        key = (file_index, row - row % self.block_size)
+
+        if key != self.block_key:
+            if key == self.next_block_key:
+                future = self.next_block
+            else:
+                future = self.executor.submit(self._load_block, *key)
+            self.next_block_key = None
+            self.next_block = None
+            self.block = future.result()
+            self.block_key = key
+
+            if self.prefetch:
+                self.next_block_key = self._following_block(key)
+                self.next_block = self.executor.submit(self._load_block, *self.next_block_key)
+
+        i = row - self.block_key[1]
+        return TraceStep(self.block["positions"][i],
+                         self.block["data_generation"][i],
+                         self.block["isl_indptr"][i],
+                         self.block["isl_indices"],
+                         self.block["gsl_indptr"][i],
+                         self.block["gsl_indices"])
+
+    def close(self):
+        self.executor.submit(self._close_files).result()
+        self.executor.shutdown()
+        self.next_block = None
+        self.block = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _following_block(self, key):
+        file_index, start = key
+        if start + self.block_size >= self.steps_per_file:
+            return file_index + 1, 0
+        return file_index, start + self.block_size
+
+    def _load_block(self, file_index, start):
+        if file_index != self.file_index:
+            self._close_files()
+            for name, (pattern, dataset) in self.files.items():
+                path = os.path.join(self.data_dir, pattern.format(file_index))
+                self.handles[name] = h5py.File(path, "r")[dataset]
+            self.file_index = file_index
+
+        rows = {}
+        for name, dset in self.handles.items():
+            rows[name] = dset[start:min(start + self.block_size, dset.shape[0])]
+
+        # decode the vlen visibility rows of the whole block into CSR once
+        block = {"positions": rows["positions"], "data_generation": rows["data_generation"]}
+        block["isl_indptr"], block["isl_indices"] = rows_to_csr(rows["isl_connections"])
+        block["gsl_indptr"], block["gsl_indices"] = rows_to_csr(rows["visible_groundstations"])
+        return block
+
+    def _close_files(self):
+        for dset in self.handles.values():
+            dset.file.close()
+        self.handles = {}
+        self.file_index = None
+
+
+class PackedTrace:
+    # memory-mapped trace written by src/calculators/trace_packer.py
+    arrays = ["positions", "data_generation", "isl_indptr", "isl_indices", "gsl_indptr", "gsl_indices"]
+
+    def __init__(self, trace_dir="data/trace"):
+        self.trace_dir = trace_dir
+        for name in self.arrays:
+            setattr(self, name, np.load(os.path.join(trace_dir, name + ".npy"), mmap_mode="r"))
+        self.num_steps = self.positions.shape[0]
+
+    def read(self, step):
+        # slices of the memory maps, nothing is decoded or copied
+        return TraceStep(self.positions[step],
+                         self.data_generation[step],
+                         self.isl_indptr[step],
+                         self.isl_indices,
+                         self.gsl_indptr[step],
+                         self.gsl_indices)
+
+    def close(self):
+        pass
+
+
+class SharedTrace:
+    # trace arrays in shared memory, created once by the parent process and attached read-only by the workers
+    arrays = PackedTrace.arrays
+
+    def __init__(self, segments, owner):
+        self.segments = segments  # {name: (SharedMemory, shape, dtype)}
+        self.owner = owner
+        for name, (segment, shape, dtype) in segments.items():
+            array = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+            if not owner:
+                array.flags.writeable = False
+            setattr(self, name, array)
+        self.num_steps = self.positions.shape[0]
+
+    @classmethod
+    def create(cls, num_steps, trace_dir=None, data_dir="data", steps_per_file=1000):
+        segments = {}
+        for name, array in load_trace(num_steps, trace_dir, data_dir, steps_per_file).items():
+            segment = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[...] = array
+            segments[name] = (segment, array.shape, array.dtype)
+        return cls(segments, owner=True)
+
+    @classmethod
+    def attach(cls, descriptor):
+        return cls({name: (shared_memory.SharedMemory(name=segment_name), shape, dtype)
+                    for name, (segment_name, shape, dtype) in descriptor.items()}, owner=False)
+
+    def descriptor(self):
+        return {name: (segment.name, shape, dtype) for name, (segment, shape, dtype) in self.segments.items()}
+
+    def read(self, step):
+        return TraceStep(self.positions[step],
+                         self.data_generation[step],
+                         self.isl_indptr[step],
+                         self.isl_indices,
+                         self.gsl_indptr[step],
+                         self.gsl_indices)
+
+    def close(self):
+        # the segments outlive the single runs of a worker, see release()
+        pass
+
+    def release(self):
+        for name in self.arrays:
+            setattr(self, name, None)
+        for segment, _, _ in self.segments.values():
+            segment.close()
+            if self.owner:
+                segment.unlink()
+        self.segments = {}
+
+
+def load_trace(num_steps, trace_dir=None, data_dir="data", steps_per_file=1000):
+    # the first num_steps of a trace as in-memory arrays in the PackedTrace layout
+    if trace_dir is not None:
+        packed = PackedTrace(trace_dir)
+        num_steps = min(num_steps, packed.num_steps)
+        arrays = {"positions": packed.positions[:num_steps], "data_generation": packed.data_generation[:num_steps]}
+        for name in ["isl", "gsl"]:
+            indptr = getattr(packed, name + "_indptr")[:num_steps]
+            arrays[name + "_indptr"] = indptr - indptr[0, 0]
+            arrays[name + "_indices"] = getattr(packed, name + "_indices")[indptr[0, 0]:indptr[-1, -1]]
+        return {name: np.array(array) for name, array in arrays.items()}
+
+    positions, data_generation = [], []
+    indptr = {"isl": [], "gsl": []}
+    indices = {"isl": [], "gsl": []}
+    offsets = {"isl": 0, "gsl": 0}
+    with TraceReader(data_dir, steps_per_file=steps_per_file) as reader:
+        for step in range(num_steps):
+            trace_step = reader.read(step)
+            positions.append(trace_step.positions)
+            data_generation.append(trace_step.data_generation)
+            for name in ["isl", "gsl"]:
+                step_indptr = getattr(trace_step, name + "_indptr")
+                indices[name].append(getattr(trace_step, name + "_indices")[step_indptr[0]:step_indptr[-1]])
+                indptr[name].append(step_indptr - step_indptr[0] + offsets[name])
+                offsets[name] += step_indptr[-1] - step_indptr[0]
+
+    arrays = {"positions": np.stack(positions), "data_generation": np.stack(data_generation)}
+    for name in ["isl", "gsl"]:
+        arrays[name + "_indptr"] = np.stack(indptr[name])
+        arrays[name + "_indices"] = np.concatenate(indices[name])
+    return arrays
+
+
+_shared_trace = None
+
+
+def attach_shared_trace(descriptor):
+    # ProcessPoolExecutor initializer, open_trace() of this worker then serves the shared trace
+    global _shared_trace
+    _shared_trace = SharedTrace.attach(descriptor)
+
+
+def open_trace(trace_dir=None, data_dir="data", steps_per_file=1000):
+    if _shared_trace is not None:
+        return _shared_trace
+    if trace_dir is not None:
+        return PackedTrace(trace_dir)
+    return TraceReader(data_dir, steps_per_file=steps_per_file)
@@ -1,7 +1,7 @@
-import pickle
 import matplotlib.pyplot as plt
 import numpy as np
 import matplotlib.colors as mcolors
+from src.results import read_results
 
 plt.rcParams.update({
     "text.usetex": True,
@@ -153,7 +153,7 @@ def get_paths(sat_failures, gs_failures, gfs):
                        "gounder",
                        "dijkstra",
                        ]:
-            filenames[strategies[i]] = [f"evaluation_data_{prefix}_{suffix}_{run}.npy" for run in range(no_of_runs)]
+            filenames[strategies[i]] = [f"evaluation_data_{prefix}_{suffix}_{run}.h5" for run in range(no_of_runs)]
             pths[strategies[i]] += [(pth + file, gf) for file in filenames[strategies[i]]]
             i += 1
     return pths
@@ -212,14 +212,7 @@ for sat_f, gs_f in scenarios:
             for strategy in paths:
                 r_list = []
                 for r in range(no_of_runs):
-                    with open(paths[strategy][r][0], 'rb') as f:
-                        d_list = []
-                        while True:
-                            try:
-                                d_list.append(pickle.load(f))
-                            except EOFError:
-                                break
-                    metric_data = np.mean([d[metric] for d in d_list])
+                    metric_data = np.mean(read_results(paths[strategy][r][0])[metric])
                     r_list.append(metric_data)
                 avg_values[gf].append(np.mean(r_list))
                 std_values[gf].append(np.std(r_list))
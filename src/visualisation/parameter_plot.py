@@ -3,22 +3,17 @@ import matplotlib.pyplot as plt
 import numpy as np
 import seaborn as sns
 import pickle
+from src.results import read_results
 
 
 def load_metric_data_from_file(filepath, metric):
     """Load metric data from the given filepath and calculate the mean over all time steps."""
     data_list = []
     try:
-        with open(filepath, 'rb') as f:
-            while True:
-                try:
-                    data = pickle.load(f)
-                    data_list.append(data[metric])
-                except EOFError:
-                    break
-    except (FileNotFoundError, pickle.UnpicklingError) as e:
+        data_list = read_results(filepath).get(metric, [])
+    except (OSError, pickle.UnpicklingError) as e:
         print(f"Error loading {filepath}: {e}")
-    return np.mean(data_list) if data_list else np.nan
+    return np.mean(data_list) if len(data_list) > 0 else np.nan
 
 
 # Define parameter ranges
@@ -36,7 +31,7 @@ def plot_single_heatmap(path, gf):
             load_metric_data_from_file(
                 os.path.join(
                     path,
-                    f"evaluation_data_tile_coded_ucb_{int(dist_prec):07d}_{int(grids)}_0_0_{gf}_0.npy"
+                    f"evaluation_data_tile_coded_ucb_{int(dist_prec):07d}_{int(grids)}_0_0_{gf}_0.h5"
                 ),
                 metric
             )
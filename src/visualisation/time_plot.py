@@ -1,8 +1,8 @@
-import _pickle
 import pickle
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.patches import Rectangle
+from src.results import read_results
 
 plt.rcParams.update({
     "text.usetex": True,
@@ -89,30 +89,20 @@ def plot_evaluation_data(
 
         data = []
         try:
-            d_list = []
-            with open(filename, 'rb') as f:
-                while True:
-                    try:
-                        d_list.append(pickle.load(f))
-                    except EOFError:
-                        break
-            data += [d_list]
-        except EOFError:
-            print(f"File corrupted: {filename}")
-            continue
-        except _pickle.UnpicklingError:
-            print(f"File corrupted: {filename}")
-            continue
+            data += [read_results(filename)]
         except FileNotFoundError:
             print(f"File not found: {filename}")
             continue
+        except (OSError, pickle.UnpicklingError):
+            print(f"File corrupted: {filename}")
+            continue
 
-        metric_data = np.array([[d[metric] for d in run][start:end] for run in data])
+        metric_data = np.array([run[metric][start:end] for run in data])
         metric_data_mean = np.mean(metric_data, axis=0)
 
         if metric == "cost":
-            delay_metric_data = np.array([[d["avg_delay"] for d in run][start:end] for run in data])
-            drop_metric_data = np.array([[d["drop_rate"] for d in run][start:end] for run in data])
+            delay_metric_data = np.array([run["avg_delay"][start:end] for run in data])
+            drop_metric_data = np.array([run["drop_rate"][start:end] for run in data])
             metric_data = (np.ones([len(drop_metric_data), len(drop_metric_data[0])]) - drop_metric_data) \
                           * delay_metric_data + 200 * drop_metric_data
             metric_data = np.mean(metric_data, axis=0)
@@ -121,11 +111,11 @@ def plot_evaluation_data(
         elif metric == "throughput":
             metric_data = metric_data_mean / 1e9
             if generation_rate is None:
-                generation_rate = np.mean([[d["generation_rate"] for d in run][start:end] for run in data],
+                generation_rate = np.mean([run["generation_rate"][start:end] for run in data],
                                           axis=0) / 1e9
         elif metric == "main_link_out":
             metric_data = (metric_data_mean *
-                           np.mean(np.array([[d["throughput"] for d in run][:end] for run in data]), axis=0) / 1e9)
+                           np.mean(np.array([run["throughput"][:end] for run in data]), axis=0) / 1e9)
         else:
             metric_data = metric_data_mean
 
@@ -211,13 +201,13 @@ def get_pths(gsl_failures, isl_failures, gf):
     suffix = str(int(gsl_failures)) + "_" + str(int(isl_failures)) + "_" + str(gf) + "_0"
 
     filenames = ([
-        "evaluation_data_random_" + suffix + ".npy",
-        "evaluation_data_bent-pipe_" + suffix + ".npy",
-        "evaluation_data_dijkstra_" + suffix + ".npy",
-        "evaluation_data_gounder_" + suffix + ".npy",
-        "evaluation_data_q_learning_" + suffix + ".npy",
-        "evaluation_data_ucb_" + suffix + ".npy",
-        "evaluation_data_tile_coded_ucb_0500000_2_" + suffix + ".npy",
+        "evaluation_data_random_" + suffix + ".h5",
+        "evaluation_data_bent-pipe_" + suffix + ".h5",
+        "evaluation_data_dijkstra_" + suffix + ".h5",
+        "evaluation_data_gounder_" + suffix + ".h5",
+        "evaluation_data_q_learning_" + suffix + ".h5",
+        "evaluation_data_ucb_" + suffix + ".h5",
+        "evaluation_data_tile_coded_ucb_0500000_2_" + suffix + ".h5",
     ])
 
     return [pth + filename for filename in filenames]